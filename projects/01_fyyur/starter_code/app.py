@@ -3,16 +3,21 @@
 #----------------------------------------------------------------------------#
 
 import json
+import base64
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import click
+from flask.cli import AppGroup
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-import logging
-from logging import Formatter, FileHandler
-from flask_wtf import Form
+from sqlalchemy import and_, or_, func, event, DDL, literal, cast, true, case
+from sqlalchemy.dialects import postgresql
 from forms import *
+from cache import ResponseCache, conditional
+from routing import RoutingSQLAlchemy, ReplicaRouter
+from request_log import RequestLog
+from perf import QueryProfiler, query_budget
+from filters import format_datetime
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -20,8 +25,12 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+request_log = RequestLog(app)
+db = RoutingSQLAlchemy(app)
 migrate = Migrate(app, db)
+cache = ResponseCache(app)
+router = ReplicaRouter(app, db)
+perf = QueryProfiler(app)
 
 # TODO: connect to a local postgresql database +
 
@@ -45,12 +54,18 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120), nullable=False)
     seeking_talent = db.Column(db.Boolean, nullable=False)
     seeking_description = db.Column(db.String(500), nullable=False)
-    past_shows = db.Column(db.ARRAY(db.Integer), nullable=False, default=[])
-    upcoming_shows = db.Column(
-        db.ARRAY(db.Integer), nullable=False, default=[])
-    past_shows_count = db.Column(db.Integer, nullable=False, default=0)
-    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
-    db.relationship('Show', backref='venue', cascade='all, delete-orphan')
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True,
+                           server_default=func.now(), onupdate=func.now())
+    # the database deletes a venue's shows (ON DELETE CASCADE), so deleting
+    # one through the session doesn't load them first
+    shows = db.relationship('Show', backref='venue', cascade='all, delete-orphan',
+                            passive_deletes=True)
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+    )
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate+
 
@@ -69,12 +84,16 @@ class Artist(db.Model):
     facebook_link = db.Column(db.String(120), nullable=False)
     seeking_venue = db.Column(db.Boolean, nullable=False)
     seeking_description = db.Column(db.String(500), nullable=False)
-    past_shows = db.Column(db.ARRAY(db.Integer), nullable=False, default=[])
-    upcoming_shows = db.Column(
-        db.ARRAY(db.Integer), nullable=False, default=[])
-    past_shows_count = db.Column(db.Integer, nullable=False, default=0)
-    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
-    db.relationship('Show', backref='artist', cascade='all, delete-orphan')
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True,
+                           server_default=func.now(), onupdate=func.now())
+    shows = db.relationship('Show', backref='artist', cascade='all, delete-orphan',
+                            passive_deletes=True)
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_Artist_state_city', 'state', 'city'),
+    )
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate+
 
@@ -82,28 +101,495 @@ class Artist(db.Model):
 class Show(db.Model):
     __tablename__ = 'Show'
     id = db.Column(db.Integer, primary_key=True)
-    start_time = db.Column(db.String(100), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey(
-        'Artist.id'), nullable=False)
+    start_time = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'),
+                         nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'),
+                          nullable=False)
+    # the time of the INSERT itself, not of the transaction's start
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           server_default=func.clock_timestamp())
+    # past/upcoming splits are range scans on the start_time indexes; the id
+    # ones count the shows added since the stats were refreshed, and the
+    # created_at ones count and date a page's shows for conditional requests
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_venue_id_id', 'venue_id', 'id'),
+        db.Index('ix_Show_artist_id_id', 'artist_id', 'id'),
+        db.Index('ix_Show_venue_id_created_at', 'venue_id', 'created_at'),
+        db.Index('ix_Show_artist_id_created_at', 'artist_id', 'created_at'),
+    )
+
+
+class Tombstone(db.Model):
+    # when rows were last deleted from each table
+    __tablename__ = 'Tombstone'
+    table_name = db.Column(db.String(120), primary_key=True)
+    deleted_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+
+class VenueStats(db.Model):
+    # show counts as of StatsWatermark, see upcoming_shows_count()
+    __tablename__ = 'VenueStats'
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'),
+                         primary_key=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ArtistStats(db.Model):
+    __tablename__ = 'ArtistStats'
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'),
+                          primary_key=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StatsWatermark(db.Model):
+    # a single row: the stats count the shows with id <= show_id, split into
+    # past and upcoming at bucketed_at
+    __tablename__ = 'StatsWatermark'
+    id = db.Column(db.Integer, primary_key=True)
+    show_id = db.Column(db.Integer, nullable=False)
+    bucketed_at = db.Column(db.DateTime(timezone=True), nullable=False)
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.+
 
+# the trigram name indexes need pg_trgm before create_all builds them
+event.listen(db.metadata, 'before_create', DDL(
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+app.jinja_env.filters['datetime'] = format_datetime
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+#----------------------------------------------------------------------------#
+# Pagination.
+#----------------------------------------------------------------------------#
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+def encode_show_cursor(start_time, show_id):
+    # opaque token for the (start_time, id) position of the last row on a page
+    token = json.dumps([start_time.isoformat(), show_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(token).decode('ascii')
+
+
+def decode_show_cursor(cursor):
+    try:
+        start_time, show_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return dateutil.parser.parse(start_time), int(show_id)
+    except (ValueError, TypeError, OverflowError):
+        abort(400)
+
+
+def parse_time_arg(name):
+    # optional datetime query argument, e.g. /shows?from=2035-05-24&to=2035-05-26
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return dateutil.parser.parse(value)
+    except (ValueError, OverflowError):
+        abort(400)
+
+#----------------------------------------------------------------------------#
+# Show timelines.
+#----------------------------------------------------------------------------#
+
+
+# Counts come from VenueStats/ArtistStats, which `flask stats refresh` brings
+# up to the watermark. Shows added since then, and counted shows that have
+# started since then, are corrected for when read, so counts are always exact
+# and adding a show writes nothing but the Show row.
+
+def show_stats(model):
+    # (stats table, its key, the matching Show column) for Venue or Artist
+    if model is Venue:
+        return VenueStats, VenueStats.venue_id, Show.venue_id
+    return ArtistStats, ArtistStats.artist_id, Show.artist_id
+
+
+def upcoming_shows_count(model, entity_id):
+    # correlated count of upcoming shows for entity_id, e.g. Venue.id
+    stats, stats_id, parent_id = show_stats(model)
+    show_id = db.session.query(StatsWatermark.show_id).as_scalar()
+    bucketed_at = db.session.query(StatsWatermark.bucketed_at).as_scalar()
+    counted = db.session.query(stats.upcoming_shows_count).filter(
+        stats_id == entity_id).as_scalar()
+    added = db.session.query(func.count(Show.id)).filter(
+        parent_id == entity_id, Show.id > func.coalesce(show_id, 0),
+        Show.start_time > func.now()).as_scalar()
+    started = db.session.query(func.count(Show.id)).filter(
+        parent_id == entity_id, Show.id <= show_id,
+        Show.start_time > bucketed_at, Show.start_time <= func.now()).as_scalar()
+    return func.coalesce(counted, 0) + added - started
+
+
+def discount_shows(*criterion):
+    # take shows that are about to be deleted out of the stats they were
+    # counted in; the table lock comes first so a concurrent refresh, which
+    # locks Show before the stats rows, can't deadlock with us
+    db.session.execute('LOCK TABLE "Show" IN ROW EXCLUSIVE MODE')
+    watermark = StatsWatermark.query.get(1)
+    if watermark is None:
+        return
+    for model in (Venue, Artist):
+        stats, stats_id, parent_id = show_stats(model)
+        gone = db.session.query(
+            parent_id.label('id'),
+            func.sum(case([(Show.start_time > watermark.bucketed_at, 1)], else_=0)).label('upcoming'),
+            func.sum(case([(Show.start_time <= watermark.bucketed_at, 1)], else_=0)).label('past')
+        ).filter(Show.id <= watermark.show_id, *criterion).group_by(parent_id).subquery()
+        db.session.execute(stats.__table__.update().values(
+            upcoming_shows_count=stats.upcoming_shows_count - gone.c.upcoming,
+            past_shows_count=stats.past_shows_count - gone.c.past
+        ).where(stats_id == gone.c.id))
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_by_name(model, search_term, page):
+    # case-insensitive substring match on name, one page at a time; on postgres
+    # the ILIKE is served by the pg_trgm GIN index and ranked by similarity
+    per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+    if db.engine.dialect.name == 'postgresql':
+        rank = func.similarity(model.name, search_term)
+    else:
+        rank = literal(0)
+    matches = db.session.query(
+        model.id,
+        model.name,
+        rank.label('rank'),
+        func.count().over().label('total')
+    ).filter(
+        model.name.ilike('%' + escape_like(search_term) + '%', escape='\\')
+    ).order_by(rank.desc(), model.name, model.id).limit(per_page).offset(
+        (page - 1) * per_page).subquery('matches')
+    # shows are only counted for the page of matches, not every match
+    rows = db.session.query(
+        matches.c.id,
+        matches.c.name,
+        matches.c.total,
+        upcoming_shows_count(model, matches.c.id).label('num_upcoming_shows')
+    ).order_by(matches.c.rank.desc(), matches.c.name, matches.c.id).all()
+    data = [{
+        "id": row.id,
+        "name": row.name,
+        "num_upcoming_shows": row.num_upcoming_shows
+    } for row in rows]
+    count = rows[0].total if rows else 0
+    return {
+        "count": count,
+        "data": data,
+        "next_page": page + 1 if page * per_page < count else None
+    }
+
+
+def faceted_search(model, seeking, args, page):
+    # filter on name/city/state/genres/seeking and count every facet of the
+    # filtered set in one UNION ALL, so the cost doesn't grow with facet count
+    per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+    query = db.session.query(
+        model.id, model.name, model.city, model.state, model.genres,
+        seeking.label('seeking'))
+    if args.get('q'):
+        query = query.filter(model.name.ilike(
+            '%' + escape_like(args['q']) + '%', escape='\\'))
+    if args.get('state'):
+        query = query.filter(model.state == args['state'])
+    if args.get('city'):
+        query = query.filter(model.city == args['city'])
+    genres = args.getlist('genre')
+    if genres:
+        # array containment, served by the GIN index on genres
+        query = query.filter(model.genres.op('@>')(
+            cast(genres, postgresql.ARRAY(db.String))))
+    if args.get('seeking') in ('true', 'false'):
+        query = query.filter(seeking.is_(args['seeking'] == 'true'))
+    matches = query.cte('matches')
+
+    genre = db.session.query(
+        func.unnest(matches.c.genres).label('value')).subquery()
+    facet_rows = db.session.query(
+        literal('city').label('facet'), matches.c.city.label('value'),
+        func.count().label('count')
+    ).group_by(matches.c.city).union_all(
+        db.session.query(literal('state'), matches.c.state,
+                         func.count()).group_by(matches.c.state),
+        db.session.query(literal('genre'), genre.c.value,
+                         func.count()).group_by(genre.c.value),
+        db.session.query(literal('seeking'), cast(matches.c.seeking, db.String),
+                         func.count()).group_by(matches.c.seeking)
+    ).subquery()
+    page_rows = db.session.query(matches).order_by(
+        matches.c.name, matches.c.id).limit(per_page).offset(
+            (page - 1) * per_page).subquery()
+    # the facets and the page come back as two JSON arrays of one row, so the
+    # whole search is a single statement
+    facet_list, hits = db.session.query(
+        db.session.query(func.json_agg(func.json_build_array(
+            facet_rows.c.facet, facet_rows.c.value, facet_rows.c.count))).as_scalar(),
+        db.session.query(func.json_agg(postgresql.aggregate_order_by(
+            func.json_build_object(
+                'id', page_rows.c.id, 'name', page_rows.c.name,
+                'city', page_rows.c.city, 'state', page_rows.c.state,
+                'genres', page_rows.c.genres, 'seeking', page_rows.c.seeking),
+            page_rows.c.name, page_rows.c.id))).as_scalar()
+    ).one()
+    facets = {'city': {}, 'state': {}, 'genre': {}, 'seeking': {}}
+    for facet, value, count in facet_list or []:
+        facets[facet][value] = count
+
+    return {
+        # every match has exactly one state, so the state facet sums to the total
+        "count": sum(facets['state'].values()),
+        "data": hits or [],
+        "facets": facets
+    }
+
+#----------------------------------------------------------------------------#
+# Conditional request validators.
+#----------------------------------------------------------------------------#
+# A page changes when its rows are written (updated_at), when a show is added,
+# and when one of its shows moves from upcoming to past, which happens at that
+# show's start_time. Adding a show writes nothing but the Show row, so
+# concurrent bookings of one venue never wait on each other. A detail page
+# counts its shows, which tells every booking apart whatever order they commit
+# in, and dates the newest by its created_at. List pages take the newest show
+# id, and its created_at, instead of counting every show, and also change when
+# rows are deleted, which Tombstone records. All of these are index scans,
+# without loading the show history.
+
+
+def latest_past_show(parent_id):
+    return db.session.query(func.max(Show.start_time)).filter(
+        parent_id, Show.start_time <= func.now()).as_scalar()
+
+
+def newest_show(parent_id):
+    return db.session.query(func.max(Show.id)).filter(parent_id).as_scalar()
+
+
+def show_changes(parent_id):
+    # one index-only scan of the (parent, created_at) index; shows are only
+    # deleted along with their venue or artist, which touch()es the other side
+    return db.session.query(
+        func.count().label('count'),
+        func.max(Show.created_at).label('created_at')
+    ).filter(parent_id).subquery()
+
+
+def detail_validators(model, parent_id, entity_id):
+    shows = show_changes(parent_id == entity_id)
+    row = db.session.query(
+        model.updated_at,
+        shows.c.count,
+        shows.c.created_at,
+        latest_past_show(parent_id == entity_id)
+    ).filter(model.id == entity_id).first()
+    if row is None:
+        return None
+    updated_at, show_count, show_created_at, past_show = row
+    last_modified = max(change for change in (updated_at, show_created_at, past_show)
+                        if change)
+    return '{}:{}:{}:{}:{}'.format(
+        model.__tablename__, entity_id, updated_at.isoformat(), show_count,
+        past_show), last_modified
+
+
+def venue_validators(venue_id):
+    return detail_validators(Venue, Show.venue_id, venue_id)
+
+
+def artist_validators(artist_id):
+    return detail_validators(Artist, Show.artist_id, artist_id)
+
+
+def list_validators(model):
+    last_deleted = db.session.query(Tombstone.deleted_at).filter(
+        Tombstone.table_name == model.__tablename__).as_scalar()
+    # the newest show by id, found with one probe of the primary key, dates
+    # the latest booking
+    newest = newest_show(true())
+    newest_created_at = db.session.query(Show.created_at).filter(
+        Show.id == newest).as_scalar()
+    updated_at, deleted_at, show_id, show_created_at, past_show = db.session.query(
+        func.max(model.updated_at),
+        last_deleted,
+        newest,
+        newest_created_at,
+        latest_past_show(true())
+    ).one()
+    changes = [change for change in (updated_at, deleted_at, show_created_at, past_show)
+               if change]
+    if not changes:
+        return None
+    return '{}:{}:{}:{}:{}'.format(
+        model.__tablename__, updated_at, deleted_at, show_id, past_show), max(changes)
+
+
+def venues_validators():
+    return list_validators(Venue)
+
+
+def artists_validators():
+    return list_validators(Artist)
+
+
+def touch(model, ids):
+    # bump updated_at for rows whose pages change through their shows
+    model.query.filter(model.id.in_(ids)).update(
+        {'updated_at': func.now()}, synchronize_session=False)
+
+
+def mark_deleted(model):
+    # deleted rows leave no updated_at behind, so list pages check this instead
+    db.session.execute(postgresql.insert(Tombstone.__table__).values(
+        table_name=model.__tablename__, deleted_at=func.now()
+    ).on_conflict_do_update(
+        index_elements=['table_name'], set_={'deleted_at': func.now()}))
+
+#----------------------------------------------------------------------------#
+# Cache invalidation.
+#----------------------------------------------------------------------------#
+
+
+def venue_page_namespaces(venue_ids):
+    # a venue's name and image also appear on the pages of artists who played there
+    artist_ids = db.session.query(Show.artist_id).filter(
+        Show.venue_id.in_(venue_ids)).distinct()
+    return ['venues', 'shows'] + ['venue:{}'.format(venue_id) for venue_id in venue_ids] + [
+        'artist:{}'.format(artist_id) for artist_id, in artist_ids]
+
+
+def artist_page_namespaces(artist_ids):
+    venue_ids = db.session.query(Show.venue_id).filter(
+        Show.artist_id.in_(artist_ids)).distinct()
+    return ['artists', 'shows'] + ['artist:{}'.format(artist_id) for artist_id in artist_ids] + [
+        'venue:{}'.format(venue_id) for venue_id, in venue_ids]
+
+
+def invalidate_pages(namespaces):
+    # past a few thousand namespaces (a large batch delete) dropping every
+    # page is cheaper than bumping each generation
+    if len(namespaces) > app.config['CACHE_INVALIDATION_LIMIT']:
+        cache.clear()
+    else:
+        cache.invalidate(*namespaces)
+
+#----------------------------------------------------------------------------#
+# Deletion.
+#----------------------------------------------------------------------------#
+# Venues and artists are deleted by id in batches, in the caller's
+# transaction. Their shows and stats rows go with them through ON DELETE
+# CASCADE, and the other side's stats and updated_at are adjusted with one
+# statement each, however many shows there were.
+
+
+def delete_rows(model, ids):
+    """Delete the venues or artists with these ids; returns the ids that
+    existed and the page namespaces to invalidate once committed."""
+    if model is Venue:
+        other, parent_id, other_id = Artist, Show.venue_id, Show.artist_id
+        namespaces = venue_page_namespaces(ids)
+    else:
+        other, parent_id, other_id = Venue, Show.artist_id, Show.venue_id
+        namespaces = artist_page_namespaces(ids)
+    touch(other, db.session.query(other_id).filter(parent_id.in_(ids)).distinct())
+    discount_shows(parent_id.in_(ids))
+    deleted = [id for id, in db.session.execute(
+        model.__table__.delete().where(model.id.in_(ids)).returning(model.id))]
+    if deleted:
+        mark_deleted(model)
+    return deleted, namespaces
+
+
+def requested_ids():
+    # {"ids": [1, 2, 3]}, at most DELETE_BATCH_SIZE of them
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if (not isinstance(ids, list) or not ids
+            or len(ids) > app.config['DELETE_BATCH_SIZE']
+            or not all(isinstance(id, int) and not isinstance(id, bool) for id in ids)):
+        abort(400)
+    return sorted(set(ids))
+
+
+def delete_batch(model, ids):
+    try:
+        deleted, namespaces = delete_rows(model, ids)
+        db.session.commit()
+    except Exception:
+        app.logger.exception('%s %s could not be deleted', model.__tablename__, ids)
+        db.session.rollback()
+        return jsonify({'success': False}), 500
+    finally:
+        db.session.close()
+    invalidate_pages(namespaces)
+    return jsonify({'success': True, 'deleted': deleted})
+
+#----------------------------------------------------------------------------#
+# Form data.
+#----------------------------------------------------------------------------#
+# Column values for submitted venue and artist forms, with the placeholders
+# the pages show for links and descriptions left empty. Shared by the create
+# controllers and the bulk importer.
+
+
+def link_or(value, placeholder):
+    return placeholder if value == '' else value
+
+
+def seeking_description_or_default(seeking, description):
+    if description != '':
+        return description
+    if seeking:
+        return 'Currently seeking performance venues'
+    return 'Not currently seeking performance venues'
+
+
+def venue_columns(data):
+    seeking_talent = data['seeking_talent'] == "True"
+    return {
+        "name": data['name'],
+        "city": data['city'],
+        "state": data['state'],
+        "address": data['address'],
+        "phone": data['phone'],
+        "genres": data.getlist('genres'),
+        "image_link": link_or(data['image_link'], 'No Image Link'),
+        "website": link_or(data['website_link'], 'No Website'),
+        "facebook_link": link_or(data['facebook_link'], 'No Facebook Link'),
+        "seeking_talent": seeking_talent,
+        "seeking_description": seeking_description_or_default(
+            seeking_talent, data['seeking_description'])
+    }
+
+
+def artist_columns(data):
+    seeking_venue = data['seeking_venue'] == "True"
+    return {
+        "name": data['name'],
+        "city": data['city'],
+        "state": data['state'],
+        "phone": data['phone'],
+        "genres": data.getlist('genres'),
+        "image_link": link_or(data['image_link'], 'No Image Link'),
+        "website_link": link_or(data['website_link'], 'No Website'),
+        "facebook_link": link_or(data['facebook_link'], 'No Facebook Link'),
+        "seeking_venue": seeking_venue,
+        "seeking_description": seeking_description_or_default(
+            seeking_venue, data['seeking_description'])
+    }
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -115,88 +601,134 @@ def index():
     return render_template('pages/home.html')
 
 
+#  Search
+#  ----------------------------------------------------------------
+
+@app.route('/search')
+@query_budget(1)
+@router.read_only
+def search():
+    # faceted search for bookers, e.g.
+    # /search?type=venues&state=CA&genre=Jazz&genre=Folk&seeking=true
+    if request.args.get('type') == 'venues':
+        model, seeking = Venue, Venue.seeking_talent
+    elif request.args.get('type') == 'artists':
+        model, seeking = Artist, Artist.seeking_venue
+    else:
+        abort(400)
+    page = max(request.args.get('page', 1, type=int), 1)
+    response = faceted_search(model, seeking, request.args, page)
+    return jsonify(response)
+
+
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@query_budget(2)
+@router.read_only
+@conditional(venues_validators)
+@cache.cached('venues')
 def venues():
-    # TODO: replace with real venues data.
-    #       num_shows should be aggregated based on number of upcoming shows per venue.+
-    venues = Venue.query.order_by('city').all()
+    # venues grouped by (state, city) in one query: a page of AREAS_PER_PAGE
+    # areas, each with its first VENUES_PER_AREA venues picked by a LATERAL
+    # subquery; /venues?city=..&state=..&page=n pages through a single area
+    per_area = app.config['VENUES_PER_AREA']
+    page = max(request.args.get('page', 1, type=int), 1)
+    city, state = request.args.get('city'), request.args.get('state')
+    areas = db.session.query(Venue.state, Venue.city).distinct()
+    if city and state:
+        areas = areas.filter(Venue.city == city, Venue.state == state)
+        area_page, venue_page = 1, page
+    else:
+        area_page, venue_page = page, 1
+    areas_per_page = app.config['AREAS_PER_PAGE']
+    areas = areas.order_by(Venue.state, Venue.city).limit(
+        areas_per_page + 1).offset((area_page - 1) * areas_per_page).subquery('areas')
+    # one extra venue per area tells us whether the area has another page
+    area_venues = db.session.query(Venue.id, Venue.name).filter(
+        Venue.state == areas.c.state, Venue.city == areas.c.city
+    ).order_by(Venue.name, Venue.id).limit(per_area + 1).offset(
+        (venue_page - 1) * per_area).correlate(areas).subquery().lateral('area_venues')
+    # upcoming shows are only counted for the venues that make it onto the page
+    rows = db.session.query(
+        areas.c.state,
+        areas.c.city,
+        area_venues.c.id,
+        area_venues.c.name,
+        upcoming_shows_count(Venue, area_venues.c.id).label('num_upcoming_shows')
+    ).select_from(areas).join(area_venues, true()).order_by(
+        areas.c.state, areas.c.city, area_venues.c.name, area_venues.c.id)
 
     data = []
-    objects_count = 0
-    for venue in venues:
-        if objects_count == 0 or not data[objects_count-1]['city'] == venue.city:
-            objects_count += 1
+    for venue in rows:
+        if not data or (data[-1]['state'], data[-1]['city']) != (venue.state, venue.city):
             data.append({
                 "city": venue.city,
                 "state": venue.state,
-                "venues": [{
-                    "id": venue.id,
-                    "name": venue.name,
-                    "num_upcoming_shows": venue.upcoming_shows_count
-                }]
-            })
-        else:
-            data[objects_count-1]['venues'].append({
-                "id": venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": venue.upcoming_shows_count
+                "venues": [],
+                "next_page": None
             })
+        if len(data[-1]['venues']) == per_area:
+            data[-1]['next_page'] = venue_page + 1
+            continue
+        data[-1]['venues'].append({
+            "id": venue.id,
+            "name": venue.name,
+            "num_upcoming_shows": venue.num_upcoming_shows
+        })
+    next_area_page = None
+    if len(data) > areas_per_page:
+        data.pop()
+        next_area_page = area_page + 1
 
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/venues.html', areas=data, next_area_page=next_area_page)
 
 
 @app.route('/venues/search', methods=['POST'])
+@query_budget(2)
+@router.read_only
 def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.+
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-    venues = Venue.query.all()
-    search_term = request.form.get('search_term', '').lower()
-    count = 0
-    data = []
-    for venue in venues:
-        if search_term in venue.name.lower():
-            count += 1
-            data.append({
-                'id': venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": venue.upcoming_shows_count
-            })
-    response = {
-        "count": count,
-        "data": data
-    }
-    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+    search_term = request.form.get('search_term', '')
+    page = request.form.get('page', 1, type=int)
+    response = search_by_name(Venue, search_term, max(page, 1))
+    return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 
 @app.route('/venues/<int:venue_id>')
+@query_budget(3)
+@router.read_only
+@conditional(venue_validators)
+@cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id+
-    venue = Venue.query.get(venue_id)
+    venue = Venue.query.get_or_404(venue_id)
+    # one joined query for the whole timeline instead of three lookups per show
+    rows = db.session.query(
+        Show.artist_id,
+        Artist.name,
+        Artist.image_link,
+        Show.start_time,
+        (Show.start_time <= func.now()).label('is_past')
+    ).join(Artist, Artist.id == Show.artist_id).filter(
+        Show.venue_id == venue_id).order_by(Show.start_time).all()
     past_shows = []
-    for shows in venue.past_shows:
-        show = Show.query.get(shows)
-        past_show = {
-            "artist_id": show.artist_id,
-            "artist_name": Artist.query.get(show.artist_id).name,
-            "artist_image_link": Artist.query.get(show.artist_id).image_link,
-            "start_time": show.start_time
-        }
-        past_shows.append(past_show)
     upcoming_shows = []
-    for shows in venue.upcoming_shows:
-        show = Show.query.get(shows)
-        upcoming_show = {
-            "artist_id": show.artist_id,
-            "artist_name": Artist.query.get(show.artist_id).name,
-            "artist_image_link": Artist.query.get(show.artist_id).image_link,
-            "start_time": show.start_time
+    for artist_id, artist_name, artist_image_link, start_time, is_past in rows:
+        show = {
+            "artist_id": artist_id,
+            "artist_name": artist_name,
+            "artist_image_link": artist_image_link,
+            "start_time": start_time
         }
-        upcoming_shows.append(upcoming_show)
+        if is_past:
+            past_shows.append(show)
+        else:
+            upcoming_shows.append(show)
     data = {
         "id": venue.id,
         "name": venue.name,
@@ -212,8 +744,8 @@ def show_venue(venue_id):
         "image_link": venue.image_link,
         "past_shows": past_shows,
         "upcoming_shows": upcoming_shows,
-        "past_shows_count": venue.past_shows_count,
-        "upcoming_shows_count": venue.upcoming_shows_count,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
     }
     return render_template('pages/show_venue.html', venue=data)
 
@@ -233,44 +765,14 @@ def create_venue_submission():
     # TODO: modify data to be the data object returned from db insertion+
     error = False
     try:
-        name = request.form['name']
-        city = request.form['city']
-        state = request.form['state']
-        address = request.form['address']
-        phone = request.form['phone']
-        genres = request.form.getlist('genres')
-        if request.form['image_link'] == '':
-            image_link = 'No Image Link'
-        else:
-            image_link = request.form['image_link']
-        if request.form['website_link'] == '':
-            website = 'No Website'
-        else:
-            website = request.form['website_link']
-        if request.form['facebook_link'] == '':
-            facebook_link = 'No Facebook Link'
-        else:
-            facebook_link = request.form['facebook_link']
-        seeking_talent = request.form['seeking_talent']
-        if seeking_talent == "True":
-            seeking_talent = True
-        else:
-            seeking_talent = False
-        if seeking_talent == True and request.form['seeking_description'] == '':
-            seeking_description = 'Currently seeking performance venues'
-        elif not seeking_talent == True and request.form['seeking_description'] == '':
-            seeking_description = 'Not currently seeking performance venues'
-        else:
-            seeking_description = request.form['seeking_description']
-        venue = Venue(name=name, city=city, state=state, phone=phone, address=address, image_link=image_link, genres=genres, website=website,
-                      facebook_link=facebook_link, seeking_talent=seeking_talent, seeking_description=seeking_description)
+        venue = Venue(**venue_columns(request.form))
         db.session.add(venue)
         db.session.commit()
+        cache.invalidate('venues')
         # on successful db insert, flash success
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
-    except Exception as error:
-        print("Oops! An exception has occured:", error)
-        print("Exception TYPE:", type(error))
+    except Exception:
+        app.logger.exception('Venue could not be listed')
         error = True
         db.session.rollback()
         flash('An error occurred. Venue ' +
@@ -284,25 +786,27 @@ def create_venue_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     # TODO: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.+
-    try:
-        Venue.query.filter_by(id=venue_id).delete()
-        db.session.commit()
-    except:
-        db.session.rollback()
-    finally:
-        db.session.close()
-
     # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
     # clicking that button delete it from the db then redirect the user to the homepage
-    return None
+    return delete_batch(Venue, [venue_id])
+
+
+@app.route('/venues', methods=['DELETE'])
+def delete_venues():
+    # DELETE /venues with {"ids": [1, 2, 3]} deletes them in one transaction
+    return delete_batch(Venue, requested_ids())
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@query_budget(2)
+@router.read_only
+@conditional(artists_validators)
+@cache.cached('artists')
 def artists():
     # TODO: replace with real data returned from querying the database+
     artists = Artist.query.all()
@@ -316,55 +820,47 @@ def artists():
 
 
 @app.route('/artists/search', methods=['POST'])
+@query_budget(2)
+@router.read_only
 def search_artists():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.+
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
-    artists = Artist.query.all()
-    search_term = request.form.get('search_term', '').lower()
-    count = 0
-    data = []
-    for artist in artists:
-        if search_term in artist.name.lower():
-            count += 1
-            data.append({
-                'id': artist.id,
-                "name": artist.name,
-                "num_upcoming_shows": artist.upcoming_shows_count
-            })
-    response = {
-        "count": count,
-        "data": data
-    }
-    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+    search_term = request.form.get('search_term', '')
+    page = request.form.get('page', 1, type=int)
+    response = search_by_name(Artist, search_term, max(page, 1))
+    return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 
 @app.route('/artists/<int:artist_id>')
+@query_budget(3)
+@router.read_only
+@conditional(artist_validators)
+@cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
-    # shows the venue page with the given venue_id
-    # TODO: replace with real venue data from the venues table, using venue_id
-    artist = Artist.query.get(artist_id)
-    venue = Venue.query.get(1)
+    # shows the artist page with the given artist_id
+    artist = Artist.query.get_or_404(artist_id)
+    rows = db.session.query(
+        Show.venue_id,
+        Venue.name,
+        Venue.image_link,
+        Show.start_time,
+        (Show.start_time <= func.now()).label('is_past')
+    ).join(Venue, Venue.id == Show.venue_id).filter(
+        Show.artist_id == artist_id).order_by(Show.start_time).all()
     past_shows = []
-    for shows in artist.past_shows:
-        show = Show.query.get(shows)
-        past_show = {
-            "venue_id": show.artist_id,
-            "venue_name": Venue.query.get(show.venue_id).name,
-            "venue_image_link": Venue.query.get(show.venue_id).image_link,
-            "start_time": show.start_time
-        }
-        past_shows.append(past_show)
     upcoming_shows = []
-    for shows in artist.upcoming_shows:
-        show = Show.query.get(shows)
-        upcoming_show = {
-            "venue_id": show.venue_id,
-            "venue_name": Venue.query.get(show.venue_id).name,
-            "venue_image_link": Venue.query.get(show.venue_id).image_link,
-            "start_time": show.start_time
+    for venue_id, venue_name, venue_image_link, start_time, is_past in rows:
+        show = {
+            "venue_id": venue_id,
+            "venue_name": venue_name,
+            "venue_image_link": venue_image_link,
+            "start_time": start_time
         }
-        upcoming_shows.append(upcoming_show)
+        if is_past:
+            past_shows.append(show)
+        else:
+            upcoming_shows.append(show)
     data = {
         "id": artist.id,
         "name": artist.name,
@@ -379,19 +875,28 @@ def show_artist(artist_id):
         "image_link": artist.image_link,
         "past_shows": past_shows,
         "upcoming_shows": upcoming_shows,
-        "past_shows_count": artist.past_shows_count,
-        "upcoming_shows_count": artist.upcoming_shows_count,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
     }
     return render_template('pages/show_artist.html', artist=data)
 
+
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+    return delete_batch(Artist, [artist_id])
+
+
+@app.route('/artists', methods=['DELETE'])
+def delete_artists():
+    return delete_batch(Artist, requested_ids())
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-    form = ArtistForm()
-    artist = Artist.query.get(artist_id)
-
-    # TODO: populate form with fields from artist with ID <artist_id>
+    artist = Artist.query.get_or_404(artist_id)
+    # the form's fields are named after the artist's columns
+    form = ArtistForm(obj=artist)
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
@@ -430,9 +935,13 @@ def edit_artist_submission(artist_id):
             artist.seeking_description = 'Not currently seeking performance venues'
         else:
             artist.seeking_description = request.form['seeking_description']
+        touch(Venue, db.session.query(Show.venue_id).filter(
+            Show.artist_id == artist_id).distinct())
         db.session.commit()
+        cache.invalidate(*artist_page_namespaces([artist_id]))
         flash('Artist ' + request.form['name'] + ' was successfully updated!')
     except:
+        app.logger.exception('Artist %s could not be updated', artist_id)
         error = True
         db.session.rollback()
         flash('An error occurred. Artist ' +
@@ -444,10 +953,8 @@ def edit_artist_submission(artist_id):
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-    form = VenueForm()
-    venue = Venue.query.get(venue_id)
-
-    # TODO: populate form with values from venue with ID <venue_id>
+    venue = Venue.query.get_or_404(venue_id)
+    form = VenueForm(obj=venue, website_link=venue.website)
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
@@ -487,12 +994,14 @@ def edit_venue_submission(venue_id):
             venue.seeking_description = 'Not currently seeking performance venues'
         else:
             venue.seeking_description = request.form['seeking_description']
+        touch(Artist, db.session.query(Show.artist_id).filter(
+            Show.venue_id == venue_id).distinct())
         db.session.commit()
+        cache.invalidate(*venue_page_namespaces([venue_id]))
         # on successful db insert, flash success
         flash('Venue ' + request.form['name'] + ' was successfully updated!')
-    except Exception as error:
-        print("Oops! An exception has occured:", error)
-        print("Exception TYPE:", type(error))
+    except Exception:
+        app.logger.exception('Venue %s could not be updated', venue_id)
         db.session.rollback()
         flash('An error occurred. Venue ' +
               request.form['name'] + ' could not be updated.')
@@ -518,40 +1027,13 @@ def create_artist_submission():
     # TODO: modify data to be the data object returned from db insertion
     error = False
     try:
-        name = request.form['name']
-        city = request.form['city']
-        state = request.form['state']
-        phone = request.form['phone']
-        if request.form['image_link'] == '':
-            image_link = 'No Image Link'
-        else:
-            image_link = request.form['image_link']
-        genres = request.form.getlist('genres')
-        if request.form['website_link'] == '':
-            website_link = 'No Website'
-        else:
-            website_link = request.form['website_link']
-        if request.form['facebook_link'] == '':
-            facebook_link = 'No Facebook Link'
-        else:
-            facebook_link = request.form['facebook_link']
-        seeking_venue = request.form['seeking_venue']
-        if seeking_venue == "True":
-            seeking_venue = True
-        else:
-            seeking_venue = False
-        if seeking_venue == True and request.form['seeking_description'] == '':
-            seeking_description = 'Currently seeking performance venues'
-        elif not seeking_venue == True and request.form['seeking_description'] == '':
-            seeking_description = 'Not currently seeking performance venues'
-        else:
-            seeking_description = request.form['seeking_description']
-        artist = Artist(name=name, city=city, state=state, phone=phone, image_link=image_link, genres=genres, website_link=website_link,
-                        facebook_link=facebook_link, seeking_venue=seeking_venue, seeking_description=seeking_description)
+        artist = Artist(**artist_columns(request.form))
         db.session.add(artist)
         db.session.commit()
+        cache.invalidate('artists')
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
     except:
+        app.logger.exception('Artist could not be listed')
         error = True
         db.session.rollback()
         flash('An error occurred. Artist ' +
@@ -570,23 +1052,59 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@query_budget(1)
+@router.read_only
+@cache.cached('shows')
 def shows():
-    # displays list of shows at /shows
-    # TODO: replace with real venues data.+
-    #       num_shows should be aggregated based on number of upcoming shows per venue.
-    shows = Show.query.all()
+    # displays list of shows at /shows, one page at a time in start_time order
+    per_page = app.config['SHOWS_PER_PAGE']
+    query = db.session.query(
+        Show.id,
+        Show.venue_id,
+        Venue.name,
+        Show.artist_id,
+        Artist.name,
+        Artist.image_link,
+        Show.start_time
+    ).join(Venue, Venue.id == Show.venue_id).join(
+        Artist, Artist.id == Show.artist_id)
+    # start_time range filters are served by the index on Show.start_time
+    filters = {}
+    start_from = parse_time_arg('from')
+    if start_from is not None:
+        query = query.filter(Show.start_time >= start_from)
+        filters['from'] = request.args['from']
+    start_to = parse_time_arg('to')
+    if start_to is not None:
+        query = query.filter(Show.start_time < start_to)
+        filters['to'] = request.args['to']
+    cursor = request.args.get('cursor')
+    if cursor:
+        # keyset pagination: continue strictly after the last row of the previous page
+        after_start_time, after_id = decode_show_cursor(cursor)
+        query = query.filter(or_(
+            Show.start_time > after_start_time,
+            and_(Show.start_time == after_start_time, Show.id > after_id)
+        ))
+    rows = query.order_by(Show.start_time, Show.id).limit(per_page + 1)
     data = []
-    for show in shows:
+    next_cursor = None
+    for show_id, venue_id, venue_name, artist_id, artist_name, artist_image_link, start_time in rows:
+        if len(data) == per_page:
+            last = data[-1]
+            next_cursor = encode_show_cursor(last['start_time'], last['id'])
+            break
         data.append({
-            "venue_id": show.venue_id,
-            "venue_name": Venue.query.get(show.venue_id).name,
-            "artist_id": show.artist_id,
-            "artist_name": Artist.query.get(show.artist_id).name,
-            "artist_image_link": Artist.query.get(show.artist_id).image_link,
-            "start_time": show.start_time
+            "id": show_id,
+            "venue_id": venue_id,
+            "venue_name": venue_name,
+            "artist_id": artist_id,
+            "artist_name": artist_name,
+            "artist_image_link": artist_image_link,
+            "start_time": start_time
         })
 
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=data, next_cursor=next_cursor, filters=filters)
 
 
 @app.route('/shows/create')
@@ -600,59 +1118,22 @@ def create_shows():
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # TODO: insert form data as a new Show record in the db, instead+
-    new_show_date = 0
-    current_date = format_datetime(babel.dates.format_datetime(format='short',
-                                                               tzinfo=babel.dates.get_timezone('America/Denver')))
-    current_day = current_date[8:10]
-    current_month = current_date[4:6]
-    current_year = current_date[14:16]
-    current_date_total = current_year+current_month+current_day
     try:
-        artist_id = request.form['artist_id']
-        venue_id = request.form['venue_id']
-        start_time = request.form['start_time']
-        year = start_time[2:4]
-        month = start_time[5:7]
-        day = start_time[8:10]
-        new_show_date = year+month+day
-
-    # on successful db insert, flash success
+        venue_id, artist_id = request.form['venue_id'], request.form['artist_id']
         show = Show(venue_id=venue_id, artist_id=artist_id,
-                    start_time=start_time)
+                    start_time=dateutil.parser.parse(request.form['start_time']))
+        # one INSERT in one transaction: past/upcoming and the pages' validators
+        # are derived from Show rows, so no venue or artist row is updated or
+        # locked beyond the foreign key checks
         db.session.add(show)
         db.session.commit()
-        # if date is in the future or today, add show to future shows, else add to past shows
-        if new_show_date >= current_date_total:
-            venue_upcoming_shows = Venue.query.get(venue_id)
-            artist_upcoming_shows = Artist.query.get(artist_id)
-            venue_upcoming_shows.upcoming_shows = list(
-                venue_upcoming_shows.upcoming_shows)
-            venue_upcoming_shows.upcoming_shows.append(show.id)
-            artist_upcoming_shows.upcoming_shows = list(
-                artist_upcoming_shows.upcoming_shows)
-            artist_upcoming_shows.upcoming_shows.append(
-                show.id)
-            venue_upcoming_shows.upcoming_shows_count += 1
-            artist_upcoming_shows.upcoming_shows_count += 1
-            db.session.commit()
-        else:
-            venue_past_shows = Venue.query.get(venue_id)
-            artist_past_shows = Artist.query.get(artist_id)
-            venue_past_shows.past_shows = list(venue_past_shows.past_shows)
-            venue_past_shows.past_shows.append(
-                show.id)
-            artist_past_shows.past_shows = list(artist_past_shows.past_shows)
-            artist_past_shows.past_shows.append(
-                show.id)
-            venue_past_shows.past_shows_count += 1
-            artist_past_shows.past_shows_count += 1
-            db.session.commit()
+        cache.invalidate('venues', 'shows', 'venue:{}'.format(venue_id),
+                         'artist:{}'.format(artist_id))
         flash('Show was successfully listed!')
-    except Exception as error:
-        print("Oops! An exception has occured:", error)
-        print("Exception TYPE:", type(error))
+    except Exception:
+        app.logger.exception('Show could not be listed')
         error = True
-        # db.session.rollback()
+        db.session.rollback()
         flash('An error occurred. Show could not be listed.')
     finally:
         db.session.close()
@@ -672,16 +1153,60 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=1000, show_default=True,
+              help='Rows per INSERT and transaction.')
+@click.option('--rejects', type=click.Path(dir_okay=False),
+              help='Where to write rejected rows [default: PATH with its extension '
+                   'replaced by .rejects.jsonl, e.g. venues.rejects.jsonl].')
+def import_command(kind, path, chunk_size, rejects):
+    """Bulk-load venues, artists or shows from a CSV or JSON-lines file."""
+    # importer imports from this module, so it is only loaded when run
+    from importer import import_file
+    import_file(kind, path, chunk_size, rejects)
+
+
+stats_cli = AppGroup('stats', help='Materialized venue and artist show counts.')
+
+
+@stats_cli.command('refresh')
+def stats_refresh_command():
+    """Count shows added since the last refresh and move started ones to past."""
+    from stats import refresh
+    show_id, bucketed_at = refresh()
+    click.echo('Show counts up to show {} as of {}'.format(show_id, bucketed_at))
+
+
+@stats_cli.command('rebuild')
+def stats_rebuild_command():
+    """Recount every venue's and artist's shows."""
+    from stats import rebuild
+    show_id, bucketed_at = rebuild()
+    click.echo('Show counts rebuilt up to show {} as of {}'.format(show_id, bucketed_at))
+
+
+@stats_cli.command('check')
+def stats_check_command():
+    """Report venues and artists whose counts differ from their shows."""
+    from stats import check
+    drift = check()
+    for name, id, expected, read in drift:
+        click.echo('{} {}: expected {} upcoming/{} past, read {}/{}'.format(
+            name, id, expected[0], expected[1], read[0], read[1]))
+    if drift:
+        raise click.ClickException(
+            '{} drifted; run `flask stats rebuild`'.format(len(drift)))
+    click.echo('No drift')
+
+
+app.cli.add_command(stats_cli)
 
 #----------------------------------------------------------------------------#
 # Launch.
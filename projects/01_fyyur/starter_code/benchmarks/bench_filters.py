@@ -0,0 +1,64 @@
+"""Per-call cost of the datetime template filter.
+
+Compares the original filter (parse the string, then babel.dates.format_datetime)
+with filters.format_datetime on a show list where start times repeat, as they
+do on /shows, and on one where every value is distinct.
+
+    python benchmarks/bench_filters.py [--calls 20000] [--distinct 200]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from filters import format_datetime  # noqa: E402
+
+
+def original_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def per_call(f, values, format):
+    start = timeit.default_timer()
+    for value in values:
+        f(value, format)
+    return (timeit.default_timer() - start) / len(values) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--distinct', type=int, default=200,
+                        help='distinct start times in the repeating workload')
+    args = parser.parse_args()
+
+    base = datetime(2035, 5, 21, 21, 30, tzinfo=timezone.utc)
+    repeating = [base + timedelta(hours=i % args.distinct) for i in range(args.calls)]
+    distinct = [base + timedelta(minutes=i) for i in range(args.calls)]
+
+    for value in repeating[:args.distinct]:
+        assert format_datetime(value, 'full') == \
+            original_format_datetime(value.isoformat(), 'full')
+
+    print('{:<34}{:>12}{:>12}'.format('workload', 'original', 'filters'))
+    for name, values in (('repeating start times', repeating),
+                         ('distinct start times', distinct)):
+        format_datetime.cache_clear()
+        before = per_call(original_format_datetime,
+                          [value.isoformat() for value in values], 'full')
+        after = per_call(format_datetime, values, 'full')
+        print('{:<34}{:>9.1f} us{:>9.1f} us'.format(name, before, after))
+
+
+if __name__ == '__main__':
+    main()
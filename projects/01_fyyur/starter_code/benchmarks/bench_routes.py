@@ -0,0 +1,338 @@
+"""Per-route throughput, latency and queries on a synthetic dataset.
+
+Seeds a local database with a reproducible dataset (the same --seed gives the
+same venues, artists and shows), then sends every route in app.py --requests
+requests from --clients concurrent test clients and reports req/s,
+p50/p95/p99 latency and SQL queries per request. Requests are made in
+process, so the numbers cover the app and the database but not an HTTP
+server; benchmarks/load_test.py measures a running server.
+
+Results are written as JSON, and --compare prints the change from an earlier
+run, so a regression shows up as a diff between two commits:
+
+    createdb fyyur_bench
+    python benchmarks/bench_routes.py --output before.json
+    git checkout my-branch
+    python benchmarks/bench_routes.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BASE_DIR)
+from load_test import percentile  # noqa: E402
+
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'),
+          ('Chicago', 'IL'), ('Seattle', 'WA'), ('Nashville', 'TN'),
+          ('New Orleans', 'LA'), ('Denver', 'CO'), ('Portland', 'OR'),
+          ('Atlanta', 'GA')]
+WORDS = ['Blue', 'Velvet', 'Hall', 'Lounge', 'Garage', 'Room', 'Club', 'Stage',
+         'Park', 'Square', 'Live', 'Music', 'Coffee', 'House', 'Wild', 'Sax',
+         'Band', 'Petals', 'Echo', 'Hop', 'Night', 'Owl', 'Copper', 'Lantern']
+QUERIES = re.compile(r'desc="(\d+) queries')
+
+
+def name(rng, words=3):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def person(rng, seeking_field, genres):
+    city, state = rng.choice(CITIES)
+    seeking = rng.random() < 0.5
+    return {
+        'name': name(rng),
+        'city': city,
+        'state': state,
+        'phone': '{:03d}-{:03d}-{:04d}'.format(
+            rng.randrange(1000), rng.randrange(1000), rng.randrange(10000)),
+        'genres': rng.sample(genres, rng.randint(1, 3)),
+        'image_link': 'https://example.com/{}.jpg'.format(rng.randrange(10 ** 6)),
+        'facebook_link': 'https://www.facebook.com/{}'.format(rng.randrange(10 ** 6)),
+        seeking_field: seeking,
+        'seeking_description': 'Looking for shows' if seeking else ''
+    }
+
+
+class Dataset(object):
+    """Row generators for a seed; ids are 1..n in generation order."""
+
+    def __init__(self, venues, artists, shows, deletable, seed):
+        from forms import VenueForm
+        self.venues, self.artists, self.shows = venues, artists, shows
+        self.deletable = deletable
+        self.seed = seed
+        self.genres = [choice for choice, _ in VenueForm.genres.kwargs['choices']]
+        # start times are spread over a year either side of the seeding day
+        self.anchor = datetime.now(timezone.utc).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+
+    def venue_rows(self):
+        rng = random.Random('venues:{}'.format(self.seed))
+        for i in range(self.venues + self.deletable):
+            row = person(rng, 'seeking_talent', self.genres)
+            row['address'] = '{} {} Street'.format(rng.randint(1, 9999), rng.choice(WORDS))
+            row['website'] = 'https://example.com/venues/{}'.format(i + 1)
+            yield row
+
+    def artist_rows(self):
+        rng = random.Random('artists:{}'.format(self.seed))
+        for i in range(self.artists):
+            row = person(rng, 'seeking_venue', self.genres)
+            row['website_link'] = 'https://example.com/artists/{}'.format(i + 1)
+            yield row
+
+    def show_rows(self):
+        rng = random.Random('shows:{}'.format(self.seed))
+        for _ in range(self.shows):
+            yield {
+                # the venues past self.venues are left without shows for the
+                # delete route
+                'venue_id': rng.randint(1, self.venues),
+                'artist_id': rng.randint(1, self.artists),
+                'start_time': self.anchor + timedelta(hours=rng.randint(-8760, 8760))
+            }
+
+
+def seed(db, dataset, chunk_size=10000):
+    from app import Venue, Artist, Show
+    from importer import copy_rows
+    from stats import rebuild
+
+    db.drop_all()
+    db.create_all()
+    for model, rows in ((Venue, dataset.venue_rows()), (Artist, dataset.artist_rows()),
+                        (Show, dataset.show_rows())):
+        started = perf_counter()
+        chunk, count = [], 0
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                copy_rows(model.__table__, chunk)
+                db.session.commit()
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            copy_rows(model.__table__, chunk)
+            db.session.commit()
+            count += len(chunk)
+        print('seeded {} {} rows in {:.1f}s'.format(
+            count, model.__tablename__, perf_counter() - started))
+    rebuild()
+    db.session.execute('ANALYZE')
+    db.session.commit()
+    db.session.remove()
+
+
+def form(rng, dataset, seeking_field):
+    data = person(rng, seeking_field, dataset.genres)
+    data[seeking_field] = str(data[seeking_field])
+    data['website_link'] = ''
+    return data
+
+
+def routes(dataset):
+    """(name, method, request builder) for every route in app.py; builders
+    take an rng and return (path, form data)."""
+    venue = lambda rng: rng.randint(1, dataset.venues)
+    artist = lambda rng: rng.randint(1, dataset.artists)
+    city = lambda rng: rng.choice(CITIES)
+    deletable = iter(range(dataset.venues + 1, dataset.venues + dataset.deletable + 1))
+    deletable_lock = threading.Lock()
+
+    def next_deletable(rng):
+        with deletable_lock:
+            return '/venues/{}'.format(next(deletable)), None
+
+    def venue_form(rng):
+        data = form(rng, dataset, 'seeking_talent')
+        data['address'] = '1 Main Street'
+        return data
+
+    return [
+        ('index', 'GET', lambda rng: ('/', None)),
+        ('venues', 'GET', lambda rng: ('/venues?page={}'.format(rng.randint(1, 3)), None)),
+        ('venues_area', 'GET', lambda rng: ('/venues?city={}&state={}'.format(
+            *city(rng)), None)),
+        ('show_venue', 'GET', lambda rng: ('/venues/{}'.format(venue(rng)), None)),
+        ('search_venues', 'POST', lambda rng: (
+            '/venues/search', {'search_term': rng.choice(WORDS)})),
+        ('artists', 'GET', lambda rng: ('/artists', None)),
+        ('show_artist', 'GET', lambda rng: ('/artists/{}'.format(artist(rng)), None)),
+        ('search_artists', 'POST', lambda rng: (
+            '/artists/search', {'search_term': rng.choice(WORDS)})),
+        ('search', 'GET', lambda rng: ('/search?type={}&state={}&genre={}'.format(
+            rng.choice(['venues', 'artists']), city(rng)[1],
+            rng.choice(dataset.genres)), None)),
+        ('shows', 'GET', lambda rng: ('/shows', None)),
+        ('shows_range', 'GET', lambda rng: ('/shows?from={}&to={}'.format(
+            (dataset.anchor + timedelta(days=rng.randint(0, 300))).date(),
+            (dataset.anchor + timedelta(days=rng.randint(301, 365))).date()), None)),
+        ('create_venue_form', 'GET', lambda rng: ('/venues/create', None)),
+        ('create_venue', 'POST', lambda rng: ('/venues/create', venue_form(rng))),
+        ('edit_venue_form', 'GET', lambda rng: ('/venues/{}/edit'.format(venue(rng)), None)),
+        ('edit_venue', 'POST', lambda rng: (
+            '/venues/{}/edit'.format(venue(rng)), venue_form(rng))),
+        ('delete_venue', 'DELETE', next_deletable),
+        ('create_artist_form', 'GET', lambda rng: ('/artists/create', None)),
+        ('create_artist', 'POST', lambda rng: (
+            '/artists/create', form(rng, dataset, 'seeking_venue'))),
+        ('edit_artist_form', 'GET', lambda rng: ('/artists/{}/edit'.format(
+            artist(rng)), None)),
+        ('edit_artist', 'POST', lambda rng: (
+            '/artists/{}/edit'.format(artist(rng)), form(rng, dataset, 'seeking_venue'))),
+        ('create_show_form', 'GET', lambda rng: ('/shows/create', None)),
+        ('create_show', 'POST', lambda rng: ('/shows/create', {
+            'venue_id': venue(rng), 'artist_id': artist(rng),
+            'start_time': str(dataset.anchor + timedelta(hours=rng.randint(1, 8760)))})),
+    ]
+
+
+def run_route(app, route, requests, clients, warmup, seed):
+    name, method, build = route
+    samples = []
+    errors = []
+    remaining = [warmup + requests]
+    lock = threading.Lock()
+
+    def client(number):
+        rng = random.Random('{}:{}:{}'.format(seed, name, number))
+        test_client = app.test_client()
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+                measured = remaining[0] < requests
+            path, data = build(rng)
+            started = perf_counter()
+            response = test_client.open(path, method=method, data=data)
+            elapsed = perf_counter() - started
+            if not measured:
+                continue
+            match = QUERIES.search(response.headers.get('Server-Timing', ''))
+            with lock:
+                samples.append((elapsed, int(match.group(1)) if match else 0))
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in samples)
+    return {
+        'requests': len(samples),
+        'errors': len(errors),
+        # warmup requests are included in the wall time, so this is a
+        # slight underestimate when --warmup is large
+        'rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, .50) * 1e3, 2),
+        'p95_ms': round(percentile(latencies, .95) * 1e3, 2),
+        'p99_ms': round(percentile(latencies, .99) * 1e3, 2),
+        'queries_per_request': round(
+            sum(queries for _, queries in samples) / max(len(samples), 1), 2)
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR).decode().strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD', '--', '.'], cwd=BASE_DIR)
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    print('\n{:<20}{:>12}{:>12}{:>14}{:>14}'.format(
+        'vs baseline', 'req/s', 'p95 ms', 'queries/req', 'p95 change'))
+    for name, now in results['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        change = ((now['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+                  if before['p95_ms'] else 0.0)
+        print('{:<20}{:>5.0f}->{:<6.0f}{:>5.1f}->{:<6.1f}{:>6.1f}->{:<7.1f}{:>+13.1f}%'.format(
+            name, before['rps'], now['rps'], before['p95_ms'], now['p95_ms'],
+            before['queries_per_request'], now['queries_per_request'], change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default='postgresql://localhost:5432/fyyur_bench',
+                        help='database to seed; everything in it is dropped')
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=10000)
+    parser.add_argument('--shows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='reuse the seeded database, including what earlier runs wrote')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='per route')
+    parser.add_argument('--warmup', type=int, default=20, help='per route, not measured')
+    parser.add_argument('--cache', action='store_true',
+                        help='leave the rendered-page cache on')
+    parser.add_argument('--routes', nargs='*', help='only these routes')
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--compare', help='earlier results to diff against')
+    args = parser.parse_args()
+
+    # config.py reads these when app is imported
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('LOG_LEVEL', 'ERROR')
+    from app import app, db
+    app.config.update(PERF_ENABLED=True, WTF_CSRF_ENABLED=False,
+                      RESPONSE_CACHE_ENABLED=args.cache)
+
+    deletable = args.warmup + args.requests
+    dataset = Dataset(args.venues, args.artists, args.shows, deletable, args.seed)
+    with app.app_context():
+        if not args.no_seed:
+            seed(db, dataset)
+
+    selected = [route for route in routes(dataset)
+                if not args.routes or route[0] in args.routes]
+    results = {
+        'commit': git_commit(),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'dataset': {'venues': args.venues, 'artists': args.artists,
+                    'shows': args.shows, 'seed': args.seed},
+        'clients': args.clients,
+        'cache': args.cache,
+        'routes': {}
+    }
+    print('{:<20}{:>8}{:>9}{:>9}{:>9}{:>9}{:>13}'.format(
+        'route', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries/req'))
+    for route in selected:
+        stats = run_route(app, route, args.requests, args.clients, args.warmup, args.seed)
+        results['routes'][route[0]] = stats
+        print('{:<20}{:>8}{:>9.1f}{:>9.2f}{:>9.2f}{:>9.2f}{:>13.2f}'.format(
+            route[0], stats['errors'], stats['rps'], stats['p50_ms'], stats['p95_ms'],
+            stats['p99_ms'], stats['queries_per_request']))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('\nresults written to {}'.format(args.output))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 1 if any(stats['errors'] for stats in results['routes'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
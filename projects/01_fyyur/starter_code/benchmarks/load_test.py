@@ -0,0 +1,152 @@
+"""Closed-loop load test against a running Fyyur server.
+
+Each client is a thread with its own keep-alive connection requesting the
+given paths round-robin as fast as responses come back. Every interval it
+prints throughput, latency percentiles, errors (5xx, timeouts, refused
+connections) and, with --dsn, the server connections the database sees, so a
+pool that leaks or a latency that creeps up shows in the trend.
+
+    FYYUR_ENV=production SECRET_KEY=... DATABASE_URL=... \\
+        gunicorn -w 4 -k gthread --threads 16 app:app
+    python benchmarks/load_test.py --clients 200 --duration 60 \\
+        --dsn postgresql://localhost:5432/fyyur
+"""
+import argparse
+import http.client
+import itertools
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = ['/venues', '/artists', '/shows', '/venues/1', '/artists/1']
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def add(self, latency, status):
+        with self.lock:
+            self.latencies.append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if not isinstance(status, int) or status >= 500:
+                self.errors += 1
+
+    def take(self):
+        with self.lock:
+            latencies, errors = sorted(self.latencies), self.errors
+            self.latencies, self.errors = [], 0
+        return latencies, errors
+
+
+def client(base, paths, stop, stats, timeout, delay):
+    # clients start spread over --ramp rather than all connecting at once
+    if stop.wait(delay):
+        return
+    url = urlsplit(base)
+    connection = None
+    for path in itertools.cycle(paths):
+        if stop.is_set():
+            break
+        if connection is None:
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80,
+                                                    timeout=timeout)
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.will_close:
+                connection.close()
+                connection = None
+        except (OSError, http.client.HTTPException) as error:
+            status = type(error).__name__
+            connection.close()
+            connection = None
+        stats.add(time.perf_counter() - started, status)
+
+
+def server_connections(dsn):
+    # connections the database sees, including idle ones parked in the pools
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    def count():
+        cursor.execute('SELECT count(*) FROM pg_stat_activity '
+                       'WHERE datname = current_database() AND pid <> pg_backend_pid()')
+        return cursor.fetchone()[0]
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--interval', type=float, default=5)
+    parser.add_argument('--ramp', type=float, default=5,
+                        help='seconds over which the clients start')
+    parser.add_argument('--warmup', type=float, default=10,
+                        help='seconds left out of the summary')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--dsn', help='database to sample connection counts from')
+    parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS)
+    args = parser.parse_args()
+
+    connections = server_connections(args.dsn) if args.dsn else None
+    stats, stop = Stats(), threading.Event()
+    threads = [threading.Thread(target=client, daemon=True, args=(
+        args.url, args.paths[i % len(args.paths):] + args.paths[:i % len(args.paths)],
+        stop, stats, args.timeout, args.ramp * i / args.clients))
+        for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+
+    print('{:>6}{:>9}{:>9}{:>9}{:>9}{:>8}{:>7}'.format(
+        'time', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors', 'conns'))
+    started = time.monotonic()
+    all_latencies, all_errors = [], 0
+    while time.monotonic() - started < args.duration:
+        time.sleep(args.interval)
+        latencies, errors = stats.take()
+        if time.monotonic() - started > args.warmup:
+            all_latencies.extend(latencies)
+            all_errors += errors
+        print('{:>5.0f}s{:>9.0f}{:>9.1f}{:>9.1f}{:>9.1f}{:>8}{:>7}'.format(
+            time.monotonic() - started, len(latencies) / args.interval,
+            percentile(latencies, .50) * 1e3, percentile(latencies, .95) * 1e3,
+            percentile(latencies, .99) * 1e3, errors,
+            connections() if connections else '-'))
+    stop.set()
+    for thread in threads:
+        thread.join(args.timeout)
+
+    all_latencies.sort()
+    measured = time.monotonic() - started - args.warmup
+    print('\nafter warmup: {} requests, {:.0f} req/s, p50 {:.1f} ms, p99 {:.1f} ms, '
+          '{} errors'.format(
+        len(all_latencies), len(all_latencies) / measured,
+        percentile(all_latencies, .50) * 1e3, percentile(all_latencies, .99) * 1e3,
+        all_errors))
+    print('statuses: {}'.format(', '.join(
+        '{}={}'.format(status, count) for status, count in sorted(
+            stats.statuses.items(), key=lambda item: str(item[0])))))
+    return 1 if all_errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
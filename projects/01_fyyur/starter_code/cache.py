@@ -0,0 +1,252 @@
+#----------------------------------------------------------------------------#
+# Rendered-page cache.
+#----------------------------------------------------------------------------#
+#
+# Pages are cached per namespace ('venues', 'venue:3', ...) and per full path,
+# so list pages keep one entry per query string. Invalidating a namespace bumps
+# its generation counter, which orphans every entry stored under the old
+# generation; the backend's LRU/TTL eviction reclaims them later. Pages behind
+# @conditional are also keyed by the version their validator computed from the
+# database, so a change made by another worker or `flask import`, which cannot
+# reach this worker's cache, still gets the page rendered again instead of the
+# old body under the new ETag.
+
+import functools
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import timezone
+from time import monotonic
+
+from flask import current_app, g, request, session, jsonify
+
+
+class CacheBackend(object):
+    """Storage used by ResponseCache. Counters must never be evicted."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, timeout):
+        raise NotImplementedError
+
+    def get_counter(self, key):
+        raise NotImplementedError
+
+    def incr(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUBackend(CacheBackend):
+    """In-process LRU with per-entry expiry, shared by the threads of one worker."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_counter(self, key):
+        return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class RedisBackend(CacheBackend):
+    """Backend for any client speaking the Redis get/set/incr commands."""
+
+    def __init__(self, client, prefix='fyyur:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=timeout)
+
+    def get_counter(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class ResponseCache(object):
+
+    def __init__(self, app=None, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 1024)
+        app.config.setdefault('RESPONSE_CACHE_TIMEOUT', 60)
+        app.config.setdefault('RESPONSE_CACHE_URL', None)
+        if self.backend is None:
+            url = app.config['RESPONSE_CACHE_URL']
+            if url:
+                # optional dependency, only needed when a shared cache is configured
+                import redis
+                self.backend = RedisBackend(redis.Redis.from_url(url))
+            else:
+                self.backend = LRUBackend(app.config['RESPONSE_CACHE_SIZE'])
+        app.add_url_rule('/__cache', 'cache_stats', self.stats_view)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _key(self, namespace, path):
+        generation = self.backend.get_counter('generation:' + namespace)
+        return 'page:{}:{}:{}:{}'.format(namespace, generation, g.get('page_version', ''),
+                                         path)
+
+    def cached(self, namespace):
+        """Cache a GET view under namespace, formatted with the view's arguments,
+        e.g. @cache.cached('venue:{venue_id}')."""
+        def decorator(f):
+            @functools.wraps(f)
+            def wrapper(*args, **kwargs):
+                # a pending flash message is rendered into the page, so such
+                # requests neither read nor fill the cache
+                if (not current_app.config['RESPONSE_CACHE_ENABLED']
+                        or request.method != 'GET' or '_flashes' in session):
+                    return f(*args, **kwargs)
+                key = self._key(namespace.format(**kwargs), request.full_path)
+                # g.fresh_read requests render the page again and replace the
+                # entry; g.response_cache_timeout shortens how long it is kept
+                entry = None if g.get('fresh_read') else self.backend.get(key)
+                if entry is not None:
+                    self._count('hits')
+                    body, content_type = entry
+                    return current_app.response_class(body, content_type=content_type)
+                self._count('misses')
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    self.backend.set(key, (response.get_data(), response.content_type),
+                                     g.get('response_cache_timeout')
+                                     or current_app.config['RESPONSE_CACHE_TIMEOUT'])
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *namespaces):
+        for namespace in set(namespaces):
+            self.backend.incr('generation:' + namespace)
+            self._count('invalidations')
+
+    def clear(self):
+        """Drop every cached page; the counters keep running, so the stats
+        still show how the cache did before and after."""
+        self.backend.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.invalidations = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0
+        }
+
+    def stats_view(self):
+        return jsonify(self.stats())
+
+
+#----------------------------------------------------------------------------#
+# Conditional responses.
+#----------------------------------------------------------------------------#
+
+
+def _http_time(value):
+    # HTTP dates are naive-UTC with whole seconds once parsed
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=0)
+
+
+def conditional(validator):
+    """Answer If-None-Match/If-Modified-Since with 304 before the view runs.
+
+    validator receives the view arguments and returns a (version, last_modified)
+    pair, or None to let the view handle the request (e.g. to 404). version is
+    any string that changes whenever the rendered page would; a cached view
+    below this decorator is cached per version.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            # a pending flash message has to be rendered, whatever the client has
+            if '_flashes' in session:
+                return f(*args, **kwargs)
+            validators = validator(**kwargs)
+            if validators is None:
+                return f(*args, **kwargs)
+            version, last_modified = validators
+            etag = hashlib.sha1(version.encode('utf-8')).hexdigest()
+            # ResponseCache keys the page by it
+            g.page_version = etag
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            elif request.if_modified_since:
+                not_modified = (_http_time(last_modified)
+                                <= _http_time(request.if_modified_since))
+            else:
+                not_modified = False
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
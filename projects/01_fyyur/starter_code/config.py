@@ -1,13 +1,89 @@
 import os
-SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+# FYYUR_ENV=production turns off debug mode, requires SECRET_KEY and
+# DATABASE_URL from the environment, and sizes the pool for several threads
+# per worker; every setting below can still be overridden from the environment.
+FYYUR_ENV = os.environ.get('FYYUR_ENV', 'development')
+PRODUCTION = FYYUR_ENV == 'production'
+
 # Enable debug mode.
-DEBUG = True
+DEBUG = not PRODUCTION
+
+if PRODUCTION:
+    # every worker has to sign sessions (and flashes) with the same key
+    SECRET_KEY = os.environ['SECRET_KEY']
+else:
+    SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 
 # Connect to the database
+if PRODUCTION:
+    SQLALCHEMY_DATABASE_URI = os.environ['DATABASE_URL']
+else:
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL', 'postgresql://shannonhurley@localhost:5432/fyyur')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Read replica for the read-only pages (see routing.py); a client reads from
+# the primary for READ_YOUR_WRITES_SECONDS after submitting a form, and an
+# unreachable replica is retried after REPLICA_RETRY_SECONDS
+SQLALCHEMY_BINDS = {}
+if os.environ.get('DATABASE_REPLICA_URL'):
+    SQLALCHEMY_BINDS['replica'] = os.environ['DATABASE_REPLICA_URL']
+READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 10))
+REPLICA_RETRY_SECONDS = int(os.environ.get('REPLICA_RETRY_SECONDS', 30))
+
+# Connection pool, per worker process. Keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below the server's max_connections.
+# pre-ping replaces connections dropped by the server or a proxy before use,
+# and recycling retires them before an idle timeout would. Statements running
+# longer than DB_STATEMENT_TIMEOUT milliseconds are cancelled by the server.
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 10 if PRODUCTION else 5)),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10 if PRODUCTION else 5)),
+    'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') != '0',
+    'connect_args': {
+        'options': '-c statement_timeout={}'.format(
+            int(os.environ.get('DB_STATEMENT_TIMEOUT', 5000 if PRODUCTION else 0)))
+    }
+}
+
+# JSON log lines, written by a background thread to LOG_FILE or to stderr;
+# requests slower than SLOW_REQUEST_MS are logged as warnings
+LOG_FILE = os.environ.get('LOG_FILE', 'error.log' if PRODUCTION else None)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+
+# Per-request SQL profiling (see perf.py): Server-Timing headers, /__perf, and
+# query budget checks; a statement repeated PERF_REPEAT_THRESHOLD times in one
+# request is logged as a possible N+1
+PERF_ENABLED = os.environ.get('PERF_ENABLED') == '1'
+PERF_REPEAT_THRESHOLD = 5
+
+# Number of shows rendered per page on /shows
+SHOWS_PER_PAGE = 50
+
+# Number of venue/artist search results rendered per page
+SEARCH_RESULTS_PER_PAGE = 20
+
+# Number of city/state areas per page on /venues, and venues listed per area
+AREAS_PER_PAGE = 20
+VENUES_PER_AREA = 10
 
+# Most venues or artists one DELETE /venues or /artists request may delete
+DELETE_BATCH_SIZE = 1000
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://shannonhurley@localhost:5432/fyyur'
+# Rendered-page cache; set RESPONSE_CACHE_URL (e.g. redis://localhost:6379/0)
+# to share it between workers instead of keeping an LRU per process
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TIMEOUT = 60
+RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL')
+# a write that changes more pages than this clears the whole cache instead
+CACHE_INVALIDATION_LIMIT = 2000
+# pages rendered from the read replica may predate the latest invalidation,
+# so they are only cached this long
+REPLICA_CACHE_TIMEOUT = 5
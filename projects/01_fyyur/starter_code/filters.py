@@ -0,0 +1,48 @@
+#----------------------------------------------------------------------------#
+# Template filters.
+#----------------------------------------------------------------------------#
+#
+# Show lists render the same few start times over and over, so the datetime
+# filter keeps babel's parsed pattern and locale per (format, locale) and a
+# bounded memo of the finished strings. Values are formatted the way
+# babel.dates.format_datetime would: naive datetimes are taken as UTC and aware
+# ones are shown in their own timezone.
+
+import functools
+from datetime import datetime, timezone
+
+import babel
+import babel.dates
+import dateutil.parser
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled(format, locale):
+    # unbounded: formats and locales come from templates, not from requests
+    return (babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)),
+            babel.Locale.parse(locale or babel.dates.LC_TIME))
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_datetime(value, format, locale):
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    pattern, locale = _compiled(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale=None):
+    """Format a datetime, or a string dateutil can parse, with a babel pattern
+    or one of the names in DATETIME_FORMATS."""
+    return _format_datetime(value, format, locale)
+
+
+format_datetime.cache_info = _format_datetime.cache_info
+format_datetime.cache_clear = _format_datetime.cache_clear
@@ -1,10 +1,101 @@
 from datetime import datetime
-from flask_wtf import Form
+from flask_wtf import FlaskForm
+from markupsafe import Markup
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.validators import DataRequired, AnyOf, URL, ValidationError
+from wtforms.widgets import Select, html_params
 
 
-class ShowForm(Form):
+class Choices(tuple):
+    """Immutable (value, label) pairs shared by every form that offers them,
+    with the set of values for validation and each option rendered once,
+    both unselected and selected."""
+
+    def __new__(cls, pairs):
+        self = super(Choices, cls).__new__(cls, pairs)
+        self.values = frozenset(value for value, _ in self)
+        self.options = tuple(
+            (value, (Select.render_option(value, label, False),
+                     Select.render_option(value, label, True)))
+            for value, label in self)
+        return self
+
+
+STATE_CHOICES = Choices((state, state) for state in (
+    'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'HI', 'ID',
+    'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM',
+    'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'PA',
+    'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY',
+))
+
+GENRE_CHOICES = Choices((genre, genre) for genre in (
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+    'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre',
+    'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other',
+))
+
+SEEKING_TALENT_CHOICES = Choices((
+    ('True', 'Currently seeking talent'),
+    ('False', 'Not currently seeking talent'),
+))
+
+SEEKING_VENUE_CHOICES = Choices((
+    ('True', 'Currently seeking performance venues'),
+    ('False', 'Not currently seeking performance venues'),
+))
+
+
+class ChoicesSelect(Select):
+    """Select widget that joins the options pre-rendered by Choices."""
+
+    def __call__(self, field, **kwargs):
+        kwargs.setdefault('id', field.id)
+        if self.multiple:
+            kwargs['multiple'] = True
+        if 'required' not in kwargs and 'required' in getattr(field, 'flags', []):
+            kwargs['required'] = True
+        selected = field.selected_values()
+        html = ['<select %s>' % html_params(name=field.name, **kwargs)]
+        html.extend(option[value in selected] for value, option in field.choices.options)
+        html.append('</select>')
+        return Markup(''.join(html))
+
+
+class ChoicesField(SelectField):
+    """SelectField over a Choices table; binding it to a form doesn't copy
+    the table, and validation is a set lookup."""
+    widget = ChoicesSelect()
+
+    def __init__(self, label=None, validators=None, choices=(), **kwargs):
+        super(ChoicesField, self).__init__(label, validators, **kwargs)
+        self.choices = choices
+
+    def selected_values(self):
+        return (self.data,)
+
+    def pre_validate(self, form):
+        if self.validate_choice and self.data not in self.choices.values:
+            raise ValidationError(self.gettext('Not a valid choice'))
+
+
+class MultipleChoicesField(SelectMultipleField):
+    widget = ChoicesSelect(multiple=True)
+
+    def __init__(self, label=None, validators=None, choices=(), **kwargs):
+        super(MultipleChoicesField, self).__init__(label, validators, **kwargs)
+        self.choices = choices
+
+    def selected_values(self):
+        return frozenset(self.data or ())
+
+    def pre_validate(self, form):
+        for value in self.data or ():
+            if value not in self.choices.values:
+                raise ValidationError(self.gettext(
+                    "'%(value)s' is not a valid choice for this field") % dict(value=value))
+
+
+class ShowForm(FlaskForm):
     artist_id = StringField(
         'artist_id'
     )
@@ -18,68 +109,16 @@ class ShowForm(Form):
     )
 
 
-class VenueForm(Form):
+class VenueForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
     city = StringField(
         'city', validators=[DataRequired()]
     )
-    state = SelectField(
+    state = ChoicesField(
         'state', validators=[DataRequired()],
-        choices=[
-            ('AL', 'AL'),
-            ('AK', 'AK'),
-            ('AZ', 'AZ'),
-            ('AR', 'AR'),
-            ('CA', 'CA'),
-            ('CO', 'CO'),
-            ('CT', 'CT'),
-            ('DE', 'DE'),
-            ('DC', 'DC'),
-            ('FL', 'FL'),
-            ('GA', 'GA'),
-            ('HI', 'HI'),
-            ('ID', 'ID'),
-            ('IL', 'IL'),
-            ('IN', 'IN'),
-            ('IA', 'IA'),
-            ('KS', 'KS'),
-            ('KY', 'KY'),
-            ('LA', 'LA'),
-            ('ME', 'ME'),
-            ('MT', 'MT'),
-            ('NE', 'NE'),
-            ('NV', 'NV'),
-            ('NH', 'NH'),
-            ('NJ', 'NJ'),
-            ('NM', 'NM'),
-            ('NY', 'NY'),
-            ('NC', 'NC'),
-            ('ND', 'ND'),
-            ('OH', 'OH'),
-            ('OK', 'OK'),
-            ('OR', 'OR'),
-            ('MD', 'MD'),
-            ('MA', 'MA'),
-            ('MI', 'MI'),
-            ('MN', 'MN'),
-            ('MS', 'MS'),
-            ('MO', 'MO'),
-            ('PA', 'PA'),
-            ('RI', 'RI'),
-            ('SC', 'SC'),
-            ('SD', 'SD'),
-            ('TN', 'TN'),
-            ('TX', 'TX'),
-            ('UT', 'UT'),
-            ('VT', 'VT'),
-            ('VA', 'VA'),
-            ('WA', 'WA'),
-            ('WV', 'WV'),
-            ('WI', 'WI'),
-            ('WY', 'WY'),
-        ]
+        choices=STATE_CHOICES
     )
     address = StringField(
         'address', validators=[DataRequired()]
@@ -90,30 +129,10 @@ class VenueForm(Form):
     image_link = StringField(
         'image_link'
     )
-    genres = SelectMultipleField(
+    genres = MultipleChoicesField(
         # TODO implement enum restriction
         'genres', validators=[DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+        choices=GENRE_CHOICES
     )
     facebook_link = StringField(
         'facebook_link', validators=[URL()]
@@ -121,80 +140,25 @@ class VenueForm(Form):
     website_link = StringField(
         'website_link', validators=[URL()]
     )
-    seeking_talent = SelectField(
+    seeking_talent = ChoicesField(
         'seeking_talent', validators=[DataRequired()],
-        choices=[
-            ('True', 'Currently seeking talent'),
-            ('False', 'Not currently seeking talent'),
-        ]
+        choices=SEEKING_TALENT_CHOICES
     )
     seeking_description = StringField(
         'seeking_description'
     )
 
 
-class ArtistForm(Form):
+class ArtistForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
     city = StringField(
         'city', validators=[DataRequired()]
     )
-    state = SelectField(
+    state = ChoicesField(
         'state', validators=[DataRequired()],
-        choices=[
-            ('AL', 'AL'),
-            ('AK', 'AK'),
-            ('AZ', 'AZ'),
-            ('AR', 'AR'),
-            ('CA', 'CA'),
-            ('CO', 'CO'),
-            ('CT', 'CT'),
-            ('DE', 'DE'),
-            ('DC', 'DC'),
-            ('FL', 'FL'),
-            ('GA', 'GA'),
-            ('HI', 'HI'),
-            ('ID', 'ID'),
-            ('IL', 'IL'),
-            ('IN', 'IN'),
-            ('IA', 'IA'),
-            ('KS', 'KS'),
-            ('KY', 'KY'),
-            ('LA', 'LA'),
-            ('ME', 'ME'),
-            ('MT', 'MT'),
-            ('NE', 'NE'),
-            ('NV', 'NV'),
-            ('NH', 'NH'),
-            ('NJ', 'NJ'),
-            ('NM', 'NM'),
-            ('NY', 'NY'),
-            ('NC', 'NC'),
-            ('ND', 'ND'),
-            ('OH', 'OH'),
-            ('OK', 'OK'),
-            ('OR', 'OR'),
-            ('MD', 'MD'),
-            ('MA', 'MA'),
-            ('MI', 'MI'),
-            ('MN', 'MN'),
-            ('MS', 'MS'),
-            ('MO', 'MO'),
-            ('PA', 'PA'),
-            ('RI', 'RI'),
-            ('SC', 'SC'),
-            ('SD', 'SD'),
-            ('TN', 'TN'),
-            ('TX', 'TX'),
-            ('UT', 'UT'),
-            ('VT', 'VT'),
-            ('VA', 'VA'),
-            ('WA', 'WA'),
-            ('WV', 'WV'),
-            ('WI', 'WI'),
-            ('WY', 'WY'),
-        ]
+        choices=STATE_CHOICES
     )
     phone = StringField(
         # TODO implement validation logic for state
@@ -203,30 +167,10 @@ class ArtistForm(Form):
     image_link = StringField(
         'image_link', validators=[URL()]
     )
-    genres = SelectMultipleField(
+    genres = MultipleChoicesField(
         # TODO implement enum restriction
         'genres', validators=[DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+        choices=GENRE_CHOICES
     )
     website_link = StringField(
         # TODO implement enum restriction
@@ -236,12 +180,9 @@ class ArtistForm(Form):
         # TODO implement enum restriction
         'facebook_link', validators=[URL()]
     )
-    seeking_venue = SelectField(
+    seeking_venue = ChoicesField(
         'seeking_talent', validators=[DataRequired()],
-        choices=[
-            ('True', 'Currently seeking performance venues'),
-            ('False', 'Not currently seeking performance venues'),
-        ]
+        choices=SEEKING_VENUE_CHOICES
     )
     seeking_description = StringField(
         'seeking_description'
@@ -0,0 +1,262 @@
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+#
+# Streams venues, artists or shows from a CSV or JSON-lines file (one object
+# per line), validates every row with the forms the web pages use, and loads
+# the valid rows with one COPY per chunk, each chunk in its own
+# transaction. Invalid rows are written to a rejects file as JSON lines and
+# the import carries on.
+#
+# Rows use the form field names. In CSV files genres are comma separated,
+# e.g. "Jazz,Folk".
+
+import csv
+import io
+import json
+import os
+from time import monotonic
+
+import click
+import dateutil.parser
+import psycopg2
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+
+from app import db, Venue, Artist, Show, venue_columns, artist_columns
+from forms import VenueForm, ArtistForm, ShowForm
+
+# web forms submit '' for links left empty, which the controllers replace
+# with placeholders; URL() only applies to links that were given
+OPTIONAL_LINKS = ('image_link', 'website_link', 'facebook_link')
+
+
+def read_rows(path):
+    """Yield (line number, row dict) pairs from a .csv or JSON-lines file."""
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            reader = csv.DictReader(f)
+            for row in reader:
+                if row.get('genres'):
+                    row['genres'] = [genre.strip() for genre in row['genres'].split(',')]
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield number, json.loads(line)
+                    except ValueError:
+                        # rejected by validate like any other bad row
+                        yield number, line.rstrip('\n')
+
+
+def form_data(row):
+    data = MultiDict()
+    for key, value in row.items():
+        values = value if isinstance(value, list) else [value]
+        for value in values:
+            data.add(key, '' if value is None else str(value))
+    return data
+
+
+class Kind(object):
+
+    def __init__(self, model, form, columns):
+        self.model = model
+        # one form, reprocessed for every row; binding fields is most of the
+        # cost of creating one
+        self.form = form(formdata=None, meta={'csrf': False})
+        self.columns = columns
+
+    def errors(self, data):
+        form = self.form
+        form.process(data)
+        form.validate()
+        errors = {field: messages for field, messages in form.errors.items()
+                  if not (field in OPTIONAL_LINKS and data.get(field, '') == '')}
+        for field in form:
+            if field.name not in data:
+                errors.setdefault(field.name, ['This field is required.'])
+        return errors
+
+    def validate(self, row):
+        """Return (columns, None) for a valid row and (None, errors) otherwise."""
+        if not isinstance(row, dict):
+            return None, {'row': ['Not a JSON object.']}
+        data = form_data(row)
+        errors = self.errors(data)
+        if errors:
+            return None, errors
+        return self.columns(data), None
+
+    def check_references(self, rows):
+        return rows, []
+
+
+def show_columns(data):
+    return {
+        "venue_id": int(data['venue_id']),
+        "artist_id": int(data['artist_id']),
+        "start_time": dateutil.parser.parse(data['start_time'])
+    }
+
+
+class ShowKind(Kind):
+
+    def __init__(self):
+        super(ShowKind, self).__init__(Show, ShowForm, show_columns)
+
+    def errors(self, data):
+        errors = super(ShowKind, self).errors(data)
+        for field in ('venue_id', 'artist_id'):
+            if not data.get(field, '').isdigit():
+                errors[field] = ['Not a valid id.']
+        return errors
+
+    def check_references(self, rows):
+        # rows pointing at missing venues or artists would fail the whole chunk
+        venue_ids = existing_ids(Venue, {row['venue_id'] for _, row in rows})
+        artist_ids = existing_ids(Artist, {row['artist_id'] for _, row in rows})
+        valid, rejected = [], []
+        for line, row in rows:
+            errors = {}
+            if row['venue_id'] not in venue_ids:
+                errors['venue_id'] = ['No venue with this id.']
+            if row['artist_id'] not in artist_ids:
+                errors['artist_id'] = ['No artist with this id.']
+            if errors:
+                rejected.append((line, row, errors))
+            else:
+                valid.append((line, row))
+        return valid, rejected
+
+
+def existing_ids(model, ids):
+    return {id for id, in db.session.query(model.id).filter(model.id.in_(ids))}
+
+
+KINDS = {
+    'venues': lambda: Kind(Venue, VenueForm, venue_columns),
+    'artists': lambda: Kind(Artist, ArtistForm, artist_columns),
+    'shows': ShowKind
+}
+
+
+class Rejects(object):
+    """Rejected rows as JSON lines; the file is only created once needed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def add(self, line, row, errors):
+        if self._file is None:
+            self._file = open(self.path, 'w')
+        self._file.write(json.dumps({'line': line, 'row': row, 'errors': errors},
+                                    default=str) + '\n')
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def pg_array(values):
+    return '{' + ','.join('"{}"'.format(
+        value.replace('\\', '\\\\').replace('"', '\\"')) for value in values) + '}'
+
+
+def copy_rows(table, rows):
+    """Load rows into table with COPY ... FROM STDIN in the session's transaction."""
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    for row in rows:
+        writer.writerow([pg_array(row[column]) if isinstance(row[column], list)
+                         else row[column] for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        table.name, ', '.join('"{}"'.format(column) for column in columns)), buffer)
+
+
+def insert_chunk(kind, rows, rejects):
+    """Insert one chunk in its own transaction; returns the number inserted.
+
+    If the COPY fails, the chunk is retried row by row in savepoints so only
+    the offending rows are rejected.
+    """
+    rows, rejected = kind.check_references(rows)
+    for line, row, errors in rejected:
+        rejects.add(line, row, errors)
+    if not rows:
+        return 0
+    table = kind.model.__table__
+    try:
+        copy_rows(table, [row for _, row in rows])
+        db.session.commit()
+        return len(rows)
+    except (DBAPIError, psycopg2.Error):
+        db.session.rollback()
+
+    inserted = 0
+    for line, row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(row))
+            inserted += 1
+        except DBAPIError as error:
+            rejects.add(line, row, {'database': [str(error.orig).strip()]})
+    db.session.commit()
+    return inserted
+
+
+def default_rejects_path(path):
+    # venues.csv -> venues.rejects.jsonl, next to the imported file
+    return os.path.splitext(path)[0] + '.rejects.jsonl'
+
+
+def import_file(kind_name, path, chunk_size=1000, rejects_path=None):
+    """Import every valid row of path; returns (inserted, rejected)."""
+    kind = KINDS[kind_name]()
+    rejects = Rejects(rejects_path or default_rejects_path(path))
+    inserted = 0
+    started = monotonic()
+    chunk = []
+
+    def report():
+        elapsed = monotonic() - started
+        click.echo('{} {} imported, {} rejected ({:.0f} rows/sec)'.format(
+            inserted, kind_name, rejects.count, (inserted + rejects.count) / elapsed))
+
+    def flush():
+        nonlocal inserted
+        inserted += insert_chunk(kind, chunk, rejects)
+        del chunk[:]
+        report()
+
+    try:
+        for line, row in read_rows(path):
+            columns, errors = kind.validate(row)
+            if errors:
+                rejects.add(line, row, errors)
+                continue
+            chunk.append((line, columns))
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+        else:
+            report()
+    finally:
+        rejects.close()
+        db.session.close()
+
+    # nothing to invalidate from here: this process's page cache is not the
+    # workers'. Their venue and artist pages are cached under the version
+    # their validators read from the database, which the new rows change;
+    # cached /shows pages expire after RESPONSE_CACHE_TIMEOUT
+    if rejects.count:
+        click.echo('Rejected rows written to {}'.format(rejects.path))
+    return inserted, rejects.count
@@ -0,0 +1,30 @@
+"""indexes for faceted venue and artist search
+
+Revision ID: 3b8d6f2a9e15
+Revises: e7b25d90f1c3
+Create Date: 2026-10-18 20:14:37.902611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8d6f2a9e15'
+down_revision = 'e7b25d90f1c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.create_index('ix_{}_genres'.format(table), table, ['genres'],
+                        unique=False, postgresql_using='gin')
+        op.create_index('ix_{}_state_city'.format(table), table, ['state', 'city'],
+                        unique=False)
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index('ix_{}_state_city'.format(table), table_name=table)
+        op.drop_index('ix_{}_genres'.format(table), table_name=table)
@@ -0,0 +1,36 @@
+"""add updated_at to venue and artist, and a tombstone table for deletes
+
+Revision ID: 7f4c2a1e8b93
+Revises: 3b8d6f2a9e15
+Create Date: 2026-10-18 21:02:55.310842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f4c2a1e8b93'
+down_revision = '3b8d6f2a9e15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Tombstone',
+    sa.Column('table_name', sa.String(length=120), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True),
+                                       server_default=sa.text('now()'), nullable=False))
+        op.create_index(op.f('ix_{}_updated_at'.format(table)), table,
+                        ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index(op.f('ix_{}_updated_at'.format(table)), table_name=table)
+        op.drop_column(table, 'updated_at')
+    op.drop_table('Tombstone')
@@ -0,0 +1,50 @@
+"""materialized venue and artist show counts
+
+Revision ID: 8c2e5b7d1a46
+Revises: d5a81c3f6b27
+Create Date: 2026-10-18 22:31:40.118205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2e5b7d1a46'
+down_revision = 'd5a81c3f6b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, parent in (('VenueStats', 'Venue'), ('ArtistStats', 'Artist')):
+        key = '{}_id'.format(parent.lower())
+        op.create_table(table,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('upcoming_shows_count', sa.Integer(), nullable=False),
+        sa.Column('past_shows_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([key], ['{}.id'.format(parent)], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(key)
+        )
+    op.create_table('StatsWatermark',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('show_id', sa.Integer(), nullable=False),
+    sa.Column('bucketed_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # count the existing shows, as `flask stats rebuild` would
+    op.execute('LOCK TABLE "Show" IN SHARE MODE')
+    op.execute('INSERT INTO "StatsWatermark" (id, show_id, bucketed_at) '
+               'SELECT 1, coalesce(max(id), 0), now() FROM "Show"')
+    for table, key in (('VenueStats', 'venue_id'), ('ArtistStats', 'artist_id')):
+        op.execute(
+            'INSERT INTO "{table}" ({key}, upcoming_shows_count, past_shows_count) '
+            'SELECT {key}, count(*) FILTER (WHERE start_time > now()), '
+            'count(*) FILTER (WHERE start_time <= now()) '
+            'FROM "Show" GROUP BY {key}'.format(table=table, key=key))
+
+
+def downgrade():
+    op.drop_table('StatsWatermark')
+    op.drop_table('ArtistStats')
+    op.drop_table('VenueStats')
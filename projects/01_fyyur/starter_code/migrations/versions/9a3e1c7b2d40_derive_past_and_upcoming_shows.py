@@ -0,0 +1,55 @@
+"""derive past and upcoming shows from start_time
+
+Revision ID: 9a3e1c7b2d40
+Revises: 46153366cfe8
+Create Date: 2026-10-18 19:05:12.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3e1c7b2d40'
+down_revision = '46153366cfe8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show',
+                    ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show',
+                    ['artist_id', 'start_time'], unique=False)
+    for table in ('Venue', 'Artist'):
+        op.drop_column(table, 'upcoming_shows_count')
+        op.drop_column(table, 'upcoming_shows')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'past_shows')
+
+
+def downgrade():
+    for table, parent_id in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.add_column(table, sa.Column('past_shows', sa.ARRAY(sa.String()),
+                                       server_default='{}', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+        op.add_column(table, sa.Column('upcoming_shows', sa.ARRAY(sa.String()),
+                                       server_default='{}', nullable=False))
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+        # rebuild the denormalized arrays from the Show table
+        op.execute(
+            'UPDATE "{table}" SET '
+            'past_shows = ARRAY(SELECT id::varchar FROM "Show" '
+            'WHERE {parent_id} = "{table}".id AND start_time <= to_char(now(), \'YYYY-MM-DD HH24:MI:SS\') ORDER BY id), '
+            'upcoming_shows = ARRAY(SELECT id::varchar FROM "Show" '
+            'WHERE {parent_id} = "{table}".id AND start_time > to_char(now(), \'YYYY-MM-DD HH24:MI:SS\') ORDER BY id)'
+            .format(table=table, parent_id=parent_id))
+        op.execute(
+            'UPDATE "{table}" SET '
+            'past_shows_count = cardinality(past_shows), '
+            'upcoming_shows_count = cardinality(upcoming_shows)'
+            .format(table=table))
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
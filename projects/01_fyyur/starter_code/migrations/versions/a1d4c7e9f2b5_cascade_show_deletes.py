@@ -0,0 +1,37 @@
+"""delete a venue's or artist's shows with it
+
+Revision ID: a1d4c7e9f2b5
+Revises: 8c2e5b7d1a46
+Create Date: 2026-10-18 23:41:07.530219
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1d4c7e9f2b5'
+down_revision = '8c2e5b7d1a46'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEYS = (('Show_venue_id_fkey', 'venue_id', 'Venue'),
+                ('Show_artist_id_fkey', 'artist_id', 'Artist'))
+
+
+def upgrade():
+    # NOT VALID keeps the swap to a brief lock; the existing rows are checked
+    # afterwards, outside the transaction, under a lock that lets writes through
+    for name, column, parent in FOREIGN_KEYS:
+        op.drop_constraint(name, 'Show', type_='foreignkey')
+        op.execute('ALTER TABLE "Show" ADD CONSTRAINT "{}" FOREIGN KEY ({}) '
+                   'REFERENCES "{}" (id) ON DELETE CASCADE NOT VALID'
+                   .format(name, column, parent))
+    with op.get_context().autocommit_block():
+        for name, column, parent in FOREIGN_KEYS:
+            op.execute('ALTER TABLE "Show" VALIDATE CONSTRAINT "{}"'.format(name))
+
+
+def downgrade():
+    for name, column, parent in FOREIGN_KEYS:
+        op.drop_constraint(name, 'Show', type_='foreignkey')
+        op.create_foreign_key(name, 'Show', parent, [column], ['id'])
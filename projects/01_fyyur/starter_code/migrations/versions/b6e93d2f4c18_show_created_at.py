@@ -0,0 +1,35 @@
+"""record when each show was added, indexed by venue and artist
+
+Revision ID: b6e93d2f4c18
+Revises: a1d4c7e9f2b5
+Create Date: 2026-10-19 10:12:44.618305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e93d2f4c18'
+down_revision = 'a1d4c7e9f2b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # now() is the same for every existing row, so adding the column doesn't
+    # rewrite the table; new shows get the time of their own INSERT
+    op.add_column('Show', sa.Column('created_at', sa.DateTime(timezone=True),
+                                    server_default=sa.text('now()'), nullable=False))
+    op.alter_column('Show', 'created_at', server_default=sa.text('clock_timestamp()'))
+    with op.get_context().autocommit_block():
+        for column in ('venue_id', 'artist_id'):
+            op.create_index('ix_Show_{}_created_at'.format(column), 'Show',
+                            [column, 'created_at'], unique=False,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_created_at', table_name='Show')
+    op.drop_index('ix_Show_venue_id_created_at', table_name='Show')
+    op.drop_column('Show', 'created_at')
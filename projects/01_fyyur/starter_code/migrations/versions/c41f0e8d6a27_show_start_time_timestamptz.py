@@ -0,0 +1,36 @@
+"""store Show.start_time as timestamptz
+
+Revision ID: c41f0e8d6a27
+Revises: 9a3e1c7b2d40
+Create Date: 2026-10-18 19:32:40.561307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f0e8d6a27'
+down_revision = '9a3e1c7b2d40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows hold 'YYYY-MM-DD HH:MM:SS' strings, which postgres casts directly
+    op.alter_column('Show', 'start_time',
+                    existing_type=sa.String(length=100),
+                    type_=sa.DateTime(timezone=True),
+                    existing_nullable=False,
+                    postgresql_using='start_time::timestamp with time zone')
+    op.create_index(op.f('ix_Show_start_time'), 'Show',
+                    ['start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_Show_start_time'), table_name='Show')
+    op.alter_column('Show', 'start_time',
+                    existing_type=sa.DateTime(timezone=True),
+                    type_=sa.String(length=100),
+                    existing_nullable=False,
+                    postgresql_using="to_char(start_time, 'YYYY-MM-DD HH24:MI:SS')")
@@ -0,0 +1,26 @@
+"""index shows by venue and artist id for the newest show of a page
+
+Revision ID: d5a81c3f6b27
+Revises: 7f4c2a1e8b93
+Create Date: 2026-10-18 21:48:12.604417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a81c3f6b27'
+down_revision = '7f4c2a1e8b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_id', 'Show', ['venue_id', 'id'], unique=False)
+    op.create_index('ix_Show_artist_id_id', 'Show', ['artist_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_id', table_name='Show')
+    op.drop_index('ix_Show_venue_id_id', table_name='Show')
@@ -0,0 +1,171 @@
+#----------------------------------------------------------------------------#
+# Query profiling.
+#----------------------------------------------------------------------------#
+#
+# With PERF_ENABLED, every request counts its SQL statements, the rows they
+# returned and the time they took, and fingerprints each statement (literals
+# and placeholders replaced by ?). The totals go out in a Server-Timing header
+# and are aggregated per endpoint at /__perf. A fingerprint executed
+# PERF_REPEAT_THRESHOLD times or more in one request is reported as an N+1
+# suspect. Views may declare a query budget with @query_budget(n), or in
+# PERF_QUERY_BUDGETS by endpoint; a request over budget is logged, or with
+# PERF_FAIL_ON_BUDGET raises QueryBudgetExceeded, which fails the test that
+# made it.
+
+import functools
+import re
+import threading
+from collections import Counter
+from time import perf_counter
+
+from flask import abort, current_app, g, has_request_context, jsonify, request
+
+from request_log import on_query
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|\?')
+IN_LIST = re.compile(r'\(\?(?:\s*,\s*\?)+\)')
+SPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(statement):
+    """The statement with literals and parameters replaced by ?, so executions
+    that differ only in their values compare equal."""
+    statement = STRING.sub('?', statement)
+    statement = NUMBER.sub('?', statement)
+    statement = PLACEHOLDER.sub('?', statement)
+    statement = IN_LIST.sub('(?)', statement)
+    return SPACE.sub(' ', statement).strip()
+
+
+def query_budget(queries):
+    """Most SQL statements the decorated view may execute per request."""
+    def decorator(f):
+        f.query_budget = queries
+        return f
+    return decorator
+
+
+def _record_query(statement, cursor, seconds):
+    if has_request_context() and 'perf_queries' in g:
+        g.perf_db_time += seconds
+        g.perf_queries[fingerprint(statement)] += 1
+        g.perf_rows += max(cursor.rowcount, 0)
+
+
+class EndpointStats(object):
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.rows = 0
+        self.db_time = 0.0
+        self.over_budget = 0
+        # fingerprint -> most executions seen in one request
+        self.repeated = {}
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'avg_queries': round(self.queries / self.requests, 2),
+            'max_queries': self.max_queries,
+            'avg_rows': round(self.rows / self.requests, 2),
+            'avg_db_ms': round(self.db_time * 1e3 / self.requests, 3),
+            'over_budget': self.over_budget,
+            'repeated': [{'statement': statement, 'count': count}
+                         for statement, count in sorted(
+                             self.repeated.items(), key=lambda item: -item[1])[:5]]
+        }
+
+
+class QueryProfiler(object):
+
+    def __init__(self, app=None):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PERF_ENABLED', False)
+        app.config.setdefault('PERF_REPEAT_THRESHOLD', 5)
+        app.config.setdefault('PERF_QUERY_BUDGETS', {})
+        app.config.setdefault('PERF_FAIL_ON_BUDGET', False)
+        # checked per request, so profiling can be switched on at run time;
+        # statements are timed by the request log's listeners
+        on_query(_record_query)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule('/__perf', 'perf_stats', self.stats_view)
+
+    def _start(self):
+        g.pop('perf_queries', None)
+        if current_app.config['PERF_ENABLED']:
+            g.perf_started = perf_counter()
+            g.perf_queries = Counter()
+            g.perf_rows = 0
+            g.perf_db_time = 0.0
+
+    def budget(self):
+        view = current_app.view_functions.get(request.endpoint)
+        return current_app.config['PERF_QUERY_BUDGETS'].get(
+            request.endpoint, getattr(view, 'query_budget', None))
+
+    def _finish(self, response):
+        if 'perf_queries' not in g:
+            return response
+        fingerprints = g.pop('perf_queries')
+        queries = sum(fingerprints.values())
+        threshold = current_app.config['PERF_REPEAT_THRESHOLD']
+        repeated = {statement: count for statement, count in fingerprints.items()
+                    if count >= threshold}
+        budget = self.budget()
+        over_budget = budget is not None and queries > budget
+
+        response.headers.add('Server-Timing', 'db;dur={:.2f};desc="{} queries, {} rows"'
+                             .format(g.perf_db_time * 1e3, queries, g.perf_rows))
+        response.headers.add('Server-Timing', 'app;dur={:.2f}'.format(
+            (perf_counter() - g.perf_started) * 1e3))
+
+        endpoint = request.endpoint or request.path
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, EndpointStats())
+            stats.requests += 1
+            stats.queries += queries
+            stats.max_queries = max(stats.max_queries, queries)
+            stats.rows += g.perf_rows
+            stats.db_time += g.perf_db_time
+            stats.over_budget += over_budget
+            for statement, count in repeated.items():
+                stats.repeated[statement] = max(stats.repeated.get(statement, 0), count)
+
+        for statement, count in repeated.items():
+            current_app.logger.warning('Possible N+1 in %s: %d x %s',
+                                       endpoint, count, statement)
+        if over_budget:
+            message = '{} ran {} queries, over its budget of {}'.format(
+                endpoint, queries, budget)
+            if current_app.config['PERF_FAIL_ON_BUDGET']:
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self.endpoints.clear()
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self.endpoints.items()}
+
+    def stats_view(self):
+        if not current_app.config['PERF_ENABLED']:
+            abort(404)
+        return jsonify(self.stats())
@@ -0,0 +1,168 @@
+#----------------------------------------------------------------------------#
+# Request logging.
+#----------------------------------------------------------------------------#
+#
+# Everything logged through app.logger goes onto an in-memory queue; a
+# QueueListener thread encodes the records as JSON lines and writes them to
+# LOG_FILE (stderr when unset), so request threads never wait on disk I/O.
+# Every request adds one record with its route, status, latency and the number
+# and total time of its database queries; requests slower than SLOW_REQUEST_MS
+# are logged as warnings. Records logged while a request is handled carry its
+# id, taken from an X-Request-ID header or generated, and echoed back in the
+# response.
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from time import perf_counter
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# extra attributes copied into the JSON record when present
+FIELDS = ('request_id', 'method', 'path', 'route', 'status', 'duration_ms',
+          'db_queries', 'db_time_ms', 'db_bind')
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestQueueHandler(QueueHandler):
+
+    def prepare(self, record):
+        # merge the arguments and render the traceback while they still exist;
+        # encoding to JSON is left to the listener thread
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RequestIdFilter(logging.Filter):
+
+    def filter(self, record):
+        if has_request_context() and 'request_id' in g:
+            record.request_id = g.request_id
+        return True
+
+
+# every statement is timed once, by the listeners below, and handed to these
+# as (statement, cursor, seconds); the request log and the profiler share them
+_query_callbacks = []
+
+
+def on_query(callback):
+    """Call callback(statement, cursor, seconds) after every SQL statement."""
+    # global listeners, shared by every app and engine in the process
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    if callback not in _query_callbacks:
+        _query_callbacks.append(callback)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # kept on the statement's own execution context, which a statement that
+    # raises takes with it; after_cursor_execute doesn't run for those
+    if context is not None:
+        context.query_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'query_started', None)
+    if started is None:
+        return
+    elapsed = perf_counter() - started
+    for callback in _query_callbacks:
+        callback(statement, cursor, elapsed)
+
+
+def _count_query(statement, cursor, seconds):
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_time += seconds
+
+
+class RequestLog(object):
+
+    def __init__(self, app=None):
+        self.queue = queue.Queue(-1)
+        self.listener = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOG_FILE', None)
+        app.config.setdefault('LOG_LEVEL', 'INFO')
+        app.config.setdefault('SLOW_REQUEST_MS', 500)
+
+        if app.config['LOG_FILE']:
+            handler = logging.FileHandler(app.config['LOG_FILE'])
+        else:
+            handler = logging.StreamHandler()
+        handler.setFormatter(JSONFormatter())
+        self.listener = QueueListener(self.queue, handler, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+        queue_handler = RequestQueueHandler(self.queue)
+        queue_handler.addFilter(RequestIdFilter())
+        app.logger.removeHandler(default_handler)
+        app.logger.addHandler(queue_handler)
+        app.logger.setLevel(app.config['LOG_LEVEL'])
+        self.logger = app.logger.getChild('requests')
+
+        on_query(_count_query)
+        app.before_request(self._start)
+        app.after_request(self._log)
+        self.slow_request_ms = app.config['SLOW_REQUEST_MS']
+
+    def _start(self):
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_started = perf_counter()
+        g.db_queries = 0
+        g.db_time = 0.0
+
+    def _log(self, response):
+        if 'request_started' not in g:
+            # an earlier before_request function failed
+            return response
+        duration_ms = (perf_counter() - g.request_started) * 1e3
+        level = logging.WARNING if duration_ms > self.slow_request_ms else logging.INFO
+        self.logger.log(level, '%s %s %s', request.method, request.path,
+                        response.status_code, extra={
+                            'method': request.method,
+                            'path': request.full_path.rstrip('?'),
+                            'route': request.url_rule.rule if request.url_rule else None,
+                            'status': response.status_code,
+                            'duration_ms': round(duration_ms, 2),
+                            'db_queries': g.db_queries,
+                            'db_time_ms': round(g.db_time * 1e3, 2),
+                            'db_bind': g.get('db_bind') or 'primary'
+                        })
+        response.headers['X-Request-ID'] = g.request_id
+        return response
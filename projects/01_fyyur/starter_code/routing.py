@@ -0,0 +1,156 @@
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#----------------------------------------------------------------------------#
+#
+# Views decorated with @router.read_only query the 'replica' bind of
+# SQLALCHEMY_BINDS when one is configured; every other request, and so every
+# write, uses the primary. A client that has just submitted a form reads from
+# the primary for READ_YOUR_WRITES_SECONDS afterwards, so replication lag never
+# hides its own changes from it. When the replica cannot be reached the view is
+# run again on the primary, and the replica is left alone for
+# REPLICA_RETRY_SECONDS.
+
+import functools
+import threading
+from time import monotonic, time
+
+from flask import current_app, g, has_app_context, jsonify, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.exc import OperationalError
+
+REPLICA = 'replica'
+
+
+class RoutingSession(SignallingSession):
+    """Session that reads from the replica while a read-only view runs."""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super(RoutingSession, self).__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        # tables with a __bind_key__ of their own keep it
+        if (has_app_context() and g.get('db_bind') == REPLICA
+                and (mapper is None or 'bind_key' not in mapper.persist_selectable.info)):
+            return self.db.get_engine(self.app, bind=REPLICA)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def replica_unreachable(error):
+    # errors the server reports (a statement timeout, a bad query) carry a
+    # SQLSTATE; failing to connect or losing the connection does not
+    return error.connection_invalidated or not getattr(error.orig, 'pgcode', None)
+
+
+class ReplicaRouter(object):
+
+    def __init__(self, app=None, db=None):
+        self.db = db
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.fallbacks = 0
+        self._down_until = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_BINDS', None)
+        app.config.setdefault('READ_YOUR_WRITES_SECONDS', 10)
+        app.config.setdefault('REPLICA_RETRY_SECONDS', 30)
+        app.config.setdefault('REPLICA_CACHE_TIMEOUT', 5)
+        app.before_request(self._reset)
+        app.after_request(self._remember_write)
+        app.add_url_rule('/__db', 'db_routing_stats', self.stats_view)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def has_replica(self):
+        return REPLICA in (current_app.config['SQLALCHEMY_BINDS'] or {})
+
+    def replica_up(self):
+        return monotonic() >= self._down_until
+
+    def _reset(self):
+        # g belongs to the app context, which a request only shares with the
+        # ones before it under test clients and the shell
+        for name in ('db_bind', 'read_only', 'fresh_read', 'response_cache_timeout'):
+            g.pop(name, None)
+
+    def _remember_write(self, response):
+        if (request.method not in ('GET', 'HEAD', 'OPTIONS')
+                and not g.get('read_only') and self.has_replica()):
+            # wall-clock time, since the client's next request may reach
+            # another worker
+            session['_primary_until'] = (
+                time() + current_app.config['READ_YOUR_WRITES_SECONDS'])
+        return response
+
+    def _wrote_recently(self):
+        primary_until = session.get('_primary_until')
+        if primary_until is None:
+            return False
+        if primary_until > time():
+            return True
+        session.pop('_primary_until')
+        return False
+
+    def read_only(self, f):
+        """Run a view that only reads on the replica, if one is up and the
+        client has not written within READ_YOUR_WRITES_SECONDS."""
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            g.read_only = True
+            if not self.has_replica() or not self.replica_up():
+                self._count('primary_reads')
+                return f(*args, **kwargs)
+            if self._wrote_recently():
+                # a page cached from the replica may predate the write
+                g.fresh_read = True
+                self._count('primary_reads')
+                return f(*args, **kwargs)
+            g.db_bind = REPLICA
+            # the replica may lag behind the writes that invalidated the cache,
+            # so what it renders is only cached briefly
+            g.response_cache_timeout = current_app.config['REPLICA_CACHE_TIMEOUT']
+            try:
+                response = f(*args, **kwargs)
+            except OperationalError as error:
+                if not replica_unreachable(error):
+                    raise
+                current_app.logger.warning(
+                    'Replica unreachable, reading from the primary: %s', error.orig)
+                self._down_until = monotonic() + current_app.config['REPLICA_RETRY_SECONDS']
+                self._count('fallbacks')
+                self.db.session.rollback()
+                g.pop('db_bind')
+                g.pop('response_cache_timeout')
+                return f(*args, **kwargs)
+            self._count('replica_reads')
+            return response
+        return wrapper
+
+    def clear(self):
+        with self._lock:
+            self.replica_reads = self.primary_reads = self.fallbacks = 0
+            self._down_until = 0
+
+    def stats(self):
+        return {
+            'replica_reads': self.replica_reads,
+            'primary_reads': self.primary_reads,
+            'fallbacks': self.fallbacks,
+            'replica_up': self.replica_up()
+        }
+
+    def stats_view(self):
+        return jsonify(self.stats())
@@ -0,0 +1,129 @@
+#----------------------------------------------------------------------------#
+# Show statistics.
+#----------------------------------------------------------------------------#
+#
+# VenueStats/ArtistStats hold upcoming and past show counts as of the
+# StatsWatermark. refresh() moves the watermark forward incrementally: shows
+# added since the last refresh are counted, and counted shows that have
+# started since are moved from upcoming to past. rebuild() recounts
+# everything, and check() compares what pages read against a direct count.
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects import postgresql
+
+from app import db, Venue, Artist, Show, StatsWatermark, show_stats
+
+
+def no_statement_timeout():
+    # DB_STATEMENT_TIMEOUT is meant for page requests, not these full scans
+    db.session.execute('SET LOCAL statement_timeout = 0')
+
+
+def lock_shows():
+    # shows committed after the watermark is read but with a lower id would
+    # never be counted, so inserts and deletes wait for the refresh
+    no_statement_timeout()
+    db.session.execute('LOCK TABLE "Show" IN SHARE MODE')
+
+
+def watermark():
+    row = StatsWatermark.query.get(1)
+    return (row.show_id, row.bucketed_at) if row else (0, None)
+
+
+def delta(parent_id, since, until_id, until_at):
+    """Per-parent (id, upcoming, past) change from the since watermark to
+    (until_id, until_at); until_id None takes every show."""
+    since_id, since_at = since
+    added = db.session.query(
+        parent_id.label('id'),
+        func.sum(case([(Show.start_time > until_at, 1)], else_=0)).label('upcoming'),
+        func.sum(case([(Show.start_time <= until_at, 1)], else_=0)).label('past')
+    ).filter(Show.id > since_id)
+    if until_id is not None:
+        added = added.filter(Show.id <= until_id)
+    changes = added.group_by(parent_id)
+    if since_at is not None:
+        started = db.session.query(
+            parent_id.label('id'),
+            (-func.count(Show.id)).label('upcoming'),
+            func.count(Show.id).label('past')
+        ).filter(Show.id <= since_id, Show.start_time > since_at,
+                 Show.start_time <= until_at).group_by(parent_id)
+        changes = changes.union_all(started)
+    changes = changes.subquery()
+    return db.session.query(
+        changes.c.id,
+        func.sum(changes.c.upcoming).label('upcoming'),
+        func.sum(changes.c.past).label('past')
+    ).group_by(changes.c.id)
+
+
+def apply(model, changes):
+    stats, stats_id, _ = show_stats(model)
+    table = stats.__table__
+    insert = postgresql.insert(table).from_select(
+        [stats_id.name, 'upcoming_shows_count', 'past_shows_count'], changes)
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=[stats_id.name],
+        set_={
+            'upcoming_shows_count': table.c.upcoming_shows_count
+            + insert.excluded.upcoming_shows_count,
+            'past_shows_count': table.c.past_shows_count + insert.excluded.past_shows_count
+        }))
+
+
+def set_watermark(show_id, bucketed_at):
+    insert = postgresql.insert(StatsWatermark.__table__).values(
+        id=1, show_id=show_id, bucketed_at=bucketed_at)
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['id'], set_={'show_id': show_id, 'bucketed_at': bucketed_at}))
+
+
+def refresh():
+    """Bring the stats up to now; returns the new (show_id, bucketed_at)."""
+    lock_shows()
+    since = watermark()
+    show_id, bucketed_at = db.session.query(
+        func.coalesce(func.max(Show.id), 0), func.now()).one()
+    show_id = max(show_id, since[0])
+    for model in (Venue, Artist):
+        _, _, parent_id = show_stats(model)
+        apply(model, delta(parent_id, since, show_id, bucketed_at))
+    set_watermark(show_id, bucketed_at)
+    db.session.commit()
+    return show_id, bucketed_at
+
+
+def rebuild():
+    """Recount every venue's and artist's shows from scratch."""
+    lock_shows()
+    for model in (Venue, Artist):
+        show_stats(model)[0].query.delete()
+    StatsWatermark.query.delete()
+    db.session.flush()
+    return refresh()
+
+
+def check():
+    """Return [(model name, id, expected, read)] for every venue or artist
+    whose (upcoming, past) counts as read by the pages differ from a count of
+    its shows."""
+    drift = []
+    no_statement_timeout()
+    since = watermark()
+    for model in (Venue, Artist):
+        stats, stats_id, parent_id = show_stats(model)
+        read = dict((id, (upcoming, past)) for id, upcoming, past in db.session.query(
+            stats_id, stats.upcoming_shows_count, stats.past_shows_count))
+        for id, upcoming, past in delta(parent_id, since, None, func.now()):
+            counted = read.get(id, (0, 0))
+            read[id] = (counted[0] + upcoming, counted[1] + past)
+        expected = dict((id, (upcoming, past)) for id, upcoming, past in delta(
+            parent_id, (0, None), None, func.now()))
+        for id in sorted(set(read) | set(expected)):
+            counts = tuple(int(count) for count in read.get(id, (0, 0)))
+            actual = tuple(int(count) for count in expected.get(id, (0, 0)))
+            if counts != actual:
+                drift.append((model.__name__, id, actual, counts))
+    return drift
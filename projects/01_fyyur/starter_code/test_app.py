@@ -0,0 +1,812 @@
+import unittest
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event, func
+from sqlalchemy.exc import DBAPIError
+
+import babel.dates
+from dateutil import tz
+from werkzeug.datastructures import MultiDict
+from wtforms.validators import ValidationError
+
+from app import app, db, cache, router, request_log, perf, Venue, Artist, Show, VenueStats, upcoming_shows_count
+from filters import format_datetime
+from request_log import JSONFormatter
+from forms import VenueForm
+from perf import QueryBudgetExceeded, fingerprint
+
+
+class QueryCounter(object):
+    """Counts the SQL statements executed on an engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.database_name = "fyyur_test"
+        self.database_path = "postgresql://{}/{}".format(
+            'localhost:5432', self.database_name)
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.database_path
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['SHOWS_PER_PAGE'] = 50
+        app.config['SEARCH_RESULTS_PER_PAGE'] = 20
+        app.config['VENUES_PER_AREA'] = 10
+        app.config['AREAS_PER_PAGE'] = 20
+        # every request made by a test is held to its view's query budget
+        app.config['PERF_ENABLED'] = True
+        app.config['PERF_FAIL_ON_BUDGET'] = True
+        app.config['PERF_QUERY_BUDGETS'] = {}
+        # most tests write straight to the db, bypassing cache invalidation
+        app.config['RESPONSE_CACHE_ENABLED'] = False
+        self.client = app.test_client
+
+        # binds the app to the current context
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.venue = Venue(name='The Musical Hop', genres=['Jazz'], city='San Francisco',
+                           state='CA', address='1015 Folsom Street', phone='123-123-1234',
+                           website='https://www.themusicalhop.com', image_link='No Image Link',
+                           facebook_link='No Facebook Link', seeking_talent=True,
+                           seeking_description='Looking for local artists')
+        self.artist = Artist(name='Guns N Petals', genres=['Rock n Roll'], city='San Francisco',
+                             state='CA', phone='326-123-5000', image_link='No Image Link',
+                             website_link='No Website', facebook_link='No Facebook Link',
+                             seeking_venue=True, seeking_description='Looking for shows')
+        db.session.add_all([self.venue, self.artist])
+        db.session.commit()
+        self.venue_id = self.venue.id
+        self.artist_id = self.artist.id
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        app.config['SQLALCHEMY_BINDS'] = {}
+        router.clear()
+        db.drop_all()
+        self.ctx.pop()
+
+    def add_shows(self, count, start_time=datetime(2035, 5, 21, 21, 30)):
+        db.session.add_all([Show(venue_id=self.venue_id, artist_id=self.artist_id,
+                                 start_time=start_time) for _ in range(count)])
+        db.session.commit()
+        db.session.remove()
+
+    def count_queries(self, url):
+        with QueryCounter(db.engine) as counter:
+            res = self.client().get(url)
+        self.assertEqual(res.status_code, 200)
+        return counter.count
+
+    def test_show_venue(self):
+        self.add_shows(2)
+        res = self.client().get(f'/venues/{self.venue_id}')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'2 Upcoming Shows', res.data)
+        self.assertIn(b'Guns N Petals', res.data)
+
+    def test_show_artist(self):
+        self.add_shows(2)
+        res = self.client().get(f'/artists/{self.artist_id}')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'2 Upcoming Shows', res.data)
+        self.assertIn(b'The Musical Hop', res.data)
+
+    def test_show_venue_splits_past_and_upcoming_by_start_time(self):
+        self.add_shows(2)
+        self.add_shows(3, start_time=datetime(2019, 5, 21, 21, 30))
+        res = self.client().get(f'/venues/{self.venue_id}')
+
+        self.assertIn(b'2 Upcoming Shows', res.data)
+        self.assertIn(b'3 Past Shows', res.data)
+
+    def test_search_venues(self):
+        res = self.client().post('/venues/search', data={'search_term': 'hop'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertIn(b'"hop": 1', res.data)
+
+    def test_search_artists_is_case_insensitive(self):
+        res = self.client().post('/artists/search', data={'search_term': 'PETALS'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Guns N Petals', res.data)
+
+    def test_search_treats_wildcards_literally(self):
+        res = self.client().post('/venues/search', data={'search_term': '%'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'"%": 0', res.data)
+
+    def test_search_pagination(self):
+        app.config['SEARCH_RESULTS_PER_PAGE'] = 1
+        db.session.add(Venue(name='Hopscotch Hall', genres=['Folk'], city='Austin',
+                             state='TX', address='1 Main St', phone='512-000-0000',
+                             website='No Website', image_link='No Image Link',
+                             facebook_link='No Facebook Link', seeking_talent=False,
+                             seeking_description='Not currently seeking talent'))
+        db.session.commit()
+        res = self.client().post('/venues/search', data={'search_term': 'hop'})
+        res_next = self.client().post(
+            '/venues/search', data={'search_term': 'hop', 'page': 2})
+
+        self.assertIn(b'"hop": 2', res.data)
+        self.assertIn(b'More results', res.data)
+        self.assertEqual(res.data.count(b'fa-music'), 1)
+        self.assertEqual(res_next.data.count(b'fa-music'), 1)
+        self.assertNotIn(b'More results', res_next.data)
+
+    def test_create_show(self):
+        res = self.client().post('/shows/create', data={
+            'venue_id': self.venue_id,
+            'artist_id': self.artist_id,
+            'start_time': '2035-05-21 21:30:00'
+        })
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(Show.query.filter_by(venue_id=self.venue_id).count(), 1)
+
+    def add_venue(self, name, city, state):
+        db.session.add(Venue(name=name, genres=['Folk'], city=city, state=state,
+                             address='1 Main St', phone='000-000-0000', website='No Website',
+                             image_link='No Image Link', facebook_link='No Facebook Link',
+                             seeking_talent=False, seeking_description='Not currently seeking talent'))
+        db.session.commit()
+
+    def test_venues_grouped_by_city_and_state(self):
+        self.add_venue('Portland Hall', 'Portland', 'OR')
+        self.add_venue('Portland Barn', 'Portland', 'ME')
+        res = self.client().get('/venues')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Portland, OR', res.data)
+        self.assertIn(b'Portland, ME', res.data)
+        self.assertIn(b'San Francisco, CA', res.data)
+
+    def test_venues_paginated_per_area(self):
+        app.config['VENUES_PER_AREA'] = 1
+        self.add_venue('Bottom of the Hill', 'San Francisco', 'CA')
+        res = self.client().get('/venues')
+        res_next = self.client().get('/venues?city=San+Francisco&state=CA&page=2')
+
+        self.assertEqual(res.data.count(b'fa-music'), 1)
+        self.assertIn(b'More venues in San Francisco, CA', res.data)
+        self.assertIn(b'Bottom of the Hill', res.data)
+        self.assertEqual(res_next.data.count(b'fa-music'), 1)
+        self.assertIn(b'The Musical Hop', res_next.data)
+        self.assertNotIn(b'More venues', res_next.data)
+
+    def test_venues_paginates_areas(self):
+        app.config['AREAS_PER_PAGE'] = 1
+        self.add_venue('Portland Hall', 'Portland', 'OR')
+        res = self.client().get('/venues')
+        res_next = self.client().get('/venues?page=2')
+
+        self.assertIn(b'San Francisco, CA', res.data)
+        self.assertNotIn(b'Portland, OR', res.data)
+        self.assertIn(b'More areas', res.data)
+        self.assertIn(b'Portland, OR', res_next.data)
+        self.assertNotIn(b'More areas', res_next.data)
+
+    def test_faceted_search(self):
+        db.session.add(Venue(name='Park Square Live Music & Coffee', genres=['Jazz', 'Folk'],
+                             city='San Francisco', state='CA', address='34 Whiskey Moore Ave',
+                             phone='415-000-1234', website='No Website',
+                             image_link='No Image Link', facebook_link='No Facebook Link',
+                             seeking_talent=False, seeking_description='Not currently seeking talent'))
+        db.session.commit()
+        with QueryCounter(db.engine) as counter:
+            res = self.client().get('/search?type=venues&state=CA&genre=Jazz')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(len(data['data']), 2)
+        self.assertEqual(data['facets']['genre'], {'Jazz': 2, 'Folk': 1})
+        self.assertEqual(data['facets']['city'], {'San Francisco': 2})
+        self.assertEqual(data['facets']['seeking'], {'true': 1, 'false': 1})
+
+    def test_faceted_search_seeking_filter(self):
+        res = self.client().get('/search?type=artists&seeking=false')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['count'], 0)
+        self.assertEqual(data['data'], [])
+
+    def test_400_faceted_search_unknown_type(self):
+        res = self.client().get('/search?type=shows')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_cached_venue_page_is_served_with_only_the_validator_query(self):
+        app.config['RESPONSE_CACHE_ENABLED'] = True
+        cache.clear()
+        cache.reset_stats()
+        self.count_queries(f'/venues/{self.venue_id}')
+        queries = self.count_queries(f'/venues/{self.venue_id}')
+        stats = json.loads(self.client().get('/__cache').data)
+
+        self.assertEqual(queries, 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_clearing_the_cache_keeps_its_stats(self):
+        app.config['RESPONSE_CACHE_ENABLED'] = True
+        cache.clear()
+        cache.reset_stats()
+        self.client().get(f'/venues/{self.venue_id}')
+        self.client().get(f'/venues/{self.venue_id}')
+        cache.clear()
+        self.client().get(f'/venues/{self.venue_id}')
+
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_create_show_invalidates_venue_and_artist_pages(self):
+        app.config['RESPONSE_CACHE_ENABLED'] = True
+        cache.clear()
+        cache.reset_stats()
+        self.client().get(f'/venues/{self.venue_id}')
+        self.client().get(f'/artists/{self.artist_id}')
+        self.client().post('/shows/create', data={
+            'venue_id': self.venue_id,
+            'artist_id': self.artist_id,
+            'start_time': '2035-05-21 21:30:00'
+        })
+        # drop the flash message so the next requests go through the cache
+        self.client().get('/')
+        venue_page = self.client().get(f'/venues/{self.venue_id}')
+        artist_page = self.client().get(f'/artists/{self.artist_id}')
+
+        self.assertIn(b'1 Upcoming Show', venue_page.data)
+        self.assertIn(b'1 Upcoming Show', artist_page.data)
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    def test_edit_artist_invalidates_pages_of_venues_played(self):
+        app.config['RESPONSE_CACHE_ENABLED'] = True
+        cache.clear()
+        self.add_shows(1)
+        self.client().get(f'/venues/{self.venue_id}')
+        self.client().post(f'/artists/{self.artist_id}/edit', data={
+            'name': 'Petals N Guns', 'city': 'San Francisco', 'state': 'CA',
+            'phone': '326-123-5000', 'image_link': '', 'genres': ['Rock n Roll'],
+            'website_link': '', 'facebook_link': '', 'seeking_venue': 'True',
+            'seeking_description': ''
+        })
+        self.client().get('/')
+        res = self.client().get(f'/venues/{self.venue_id}')
+
+        self.assertIn(b'Petals N Guns', res.data)
+
+    def test_304_venue_page_if_none_match(self):
+        etag = self.client().get(f'/venues/{self.venue_id}').headers['ETag']
+        with QueryCounter(db.engine) as counter:
+            res = self.client().get(f'/venues/{self.venue_id}',
+                                    headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(counter.count, 1)
+
+    def test_304_artist_page_if_modified_since(self):
+        last_modified = self.client().get(
+            f'/artists/{self.artist_id}').headers['Last-Modified']
+        res = self.client().get(f'/artists/{self.artist_id}',
+                                headers={'If-Modified-Since': last_modified})
+
+        self.assertEqual(res.status_code, 304)
+
+    def test_create_show_after_if_modified_since(self):
+        # pages fetched a minute ago, so the booking is in a later second
+        for model in (Venue, Artist):
+            model.query.update({'updated_at': func.now() - timedelta(minutes=1)},
+                               synchronize_session=False)
+        db.session.commit()
+        venue_modified = self.client().get(
+            f'/venues/{self.venue_id}').headers['Last-Modified']
+        artist_modified = self.client().get(
+            f'/artists/{self.artist_id}').headers['Last-Modified']
+        self.client().post('/shows/create', data={
+            'venue_id': self.venue_id,
+            'artist_id': self.artist_id,
+            'start_time': '2035-05-21 21:30:00'
+        })
+        self.client().get('/')
+        venue_page = self.client().get(f'/venues/{self.venue_id}',
+                                       headers={'If-Modified-Since': venue_modified})
+        artist_page = self.client().get(f'/artists/{self.artist_id}',
+                                        headers={'If-Modified-Since': artist_modified})
+
+        self.assertEqual(venue_page.status_code, 200)
+        self.assertIn(b'1 Upcoming Show', venue_page.data)
+        self.assertEqual(artist_page.status_code, 200)
+        self.assertIn(b'1 Upcoming Show', artist_page.data)
+
+    def test_create_show_after_venues_if_modified_since(self):
+        Venue.query.update({'updated_at': func.now() - timedelta(minutes=1)},
+                           synchronize_session=False)
+        Artist.query.update({'updated_at': func.now() - timedelta(minutes=1)},
+                            synchronize_session=False)
+        db.session.commit()
+        last_modified = self.client().get('/venues').headers['Last-Modified']
+        self.client().post('/shows/create', data={
+            'venue_id': self.venue_id,
+            'artist_id': self.artist_id,
+            'start_time': '2035-05-21 21:30:00'
+        })
+        self.client().get('/')
+        res = self.client().get('/venues', headers={'If-Modified-Since': last_modified})
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_cached_venues_page_follows_writes_of_other_workers(self):
+        app.config['RESPONSE_CACHE_ENABLED'] = True
+        cache.clear()
+        etag = self.client().get('/venues').headers['ETag']
+        # written the way another worker or flask import would, leaving this
+        # worker's cache alone
+        self.add_venue('Park Square Live Music & Coffee', 'San Francisco', 'CA')
+        res = self.client().get('/venues')
+        revalidated = self.client().get('/venues', headers={'If-None-Match': etag})
+
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertIn(b'Park Square', res.data)
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertIn(b'Park Square', revalidated.data)
+
+    def test_import_shows_changes_venue_etag(self):
+        etag = self.client().get(f'/venues/{self.venue_id}').headers['ETag']
+        path = self.write_file('.jsonl', json.dumps({
+            'venue_id': self.venue_id, 'artist_id': self.artist_id,
+            'start_time': '2035-05-21 21:30:00'}))
+        app.test_cli_runner().invoke(args=['import', 'shows', path])
+        res = self.client().get(f'/venues/{self.venue_id}',
+                                headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_create_show_changes_venue_and_artist_etags(self):
+        venue_etag = self.client().get(f'/venues/{self.venue_id}').headers['ETag']
+        artist_etag = self.client().get(f'/artists/{self.artist_id}').headers['ETag']
+        self.client().post('/shows/create', data={
+            'venue_id': self.venue_id,
+            'artist_id': self.artist_id,
+            'start_time': '2035-05-21 21:30:00'
+        })
+        self.client().get('/')
+        venue_page = self.client().get(f'/venues/{self.venue_id}',
+                                       headers={'If-None-Match': venue_etag})
+        artist_page = self.client().get(f'/artists/{self.artist_id}',
+                                        headers={'If-None-Match': artist_etag})
+
+        self.assertEqual(venue_page.status_code, 200)
+        self.assertEqual(artist_page.status_code, 200)
+        self.assertIn(b'1 Upcoming Show', venue_page.data)
+
+    def test_concurrent_show_creation_loses_no_shows(self):
+        def book():
+            client = app.test_client()
+            for _ in range(5):
+                client.post('/shows/create', data={
+                    'venue_id': self.venue_id,
+                    'artist_id': self.artist_id,
+                    'start_time': '2035-05-21 21:30:00'
+                })
+        threads = [threading.Thread(target=book) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        venue_page = self.client().get(f'/venues/{self.venue_id}')
+        artist_page = self.client().get(f'/artists/{self.artist_id}')
+
+        self.assertIn(b'40 Upcoming Shows', venue_page.data)
+        self.assertIn(b'40 Upcoming Shows', artist_page.data)
+
+    def test_edit_venue_form_is_filled_from_venue(self):
+        res = self.client().get(f'/venues/{self.venue_id}/edit')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'<option selected value="CA">CA</option>', res.data)
+        self.assertIn(b'<option selected value="Jazz">Jazz</option>', res.data)
+        self.assertIn(b'<option value="Folk">Folk</option>', res.data)
+        self.assertIn(b'value="https://www.themusicalhop.com"', res.data)
+        self.assertEqual(self.client().get('/venues/100000/edit').status_code, 404)
+
+    def test_edit_artist_changes_etags_of_venues_played(self):
+        self.add_shows(1)
+        etag = self.client().get(f'/venues/{self.venue_id}').headers['ETag']
+        self.client().post(f'/artists/{self.artist_id}/edit', data={
+            'name': 'Petals N Guns', 'city': 'San Francisco', 'state': 'CA',
+            'phone': '326-123-5000', 'image_link': '', 'genres': ['Rock n Roll'],
+            'website_link': '', 'facebook_link': '', 'seeking_venue': 'True',
+            'seeking_description': ''
+        })
+        self.client().get('/')
+        res = self.client().get(f'/venues/{self.venue_id}',
+                                headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Petals N Guns', res.data)
+
+    def test_delete_venue_changes_venues_etag(self):
+        self.add_venue('Park Square Live Music & Coffee', 'San Francisco', 'CA')
+        other = Venue.query.filter_by(name='Park Square Live Music & Coffee').one().id
+        etag = self.client().get('/venues').headers['ETag']
+        self.client().delete(f'/venues/{other}')
+        res = self.client().get('/venues', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn(b'Park Square', res.data)
+
+    def use_replica(self, database_name):
+        app.config['SQLALCHEMY_BINDS'] = {
+            'replica': 'postgresql://localhost:5432/{}'.format(database_name)}
+        return db.get_engine(app, 'replica')
+
+    def test_read_only_pages_read_from_replica_until_client_writes(self):
+        replica = self.use_replica('fyyur_replica_test')
+        db.Model.metadata.create_all(replica)
+        self.addCleanup(db.Model.metadata.drop_all, replica)
+        # a replica that has not caught up with the venue's rename yet
+        venue = dict(db.session.execute(
+            Venue.__table__.select().where(Venue.id == self.venue_id)).first())
+        replica.execute(Venue.__table__.insert().values(venue, name='The Replica Hop'))
+        db.session.remove()
+        client = app.test_client()
+
+        self.assertIn(b'The Replica Hop', client.get(f'/venues/{self.venue_id}').data)
+        client.post('/shows/create', data={
+            'venue_id': self.venue_id,
+            'artist_id': self.artist_id,
+            'start_time': '2035-05-21 21:30:00'
+        })
+        self.assertIn(b'The Musical Hop', client.get(f'/venues/{self.venue_id}').data)
+        self.assertIn(b'The Replica Hop',
+                      self.client().get(f'/venues/{self.venue_id}').data)
+
+    def test_read_only_pages_fall_back_to_primary(self):
+        self.use_replica('fyyur_no_such_replica')
+        first = self.client().get(f'/venues/{self.venue_id}')
+        second = self.client().get(f'/venues/{self.venue_id}')
+
+        self.assertIn(b'The Musical Hop', first.data)
+        self.assertIn(b'The Musical Hop', second.data)
+        self.assertEqual(router.stats()['fallbacks'], 1)
+
+    def log_records(self, request):
+        records = []
+        capture = logging.Handler()
+        capture.emit = records.append
+        listener = request_log.listener
+        listener.handlers += (capture,)
+        try:
+            response = request()
+        finally:
+            # stopping the listener drains the queue
+            listener.stop()
+            listener.handlers = listener.handlers[:-1]
+            listener.start()
+        return response, [json.loads(JSONFormatter().format(record)) for record in records]
+
+    def test_request_log_records_route_latency_and_queries(self):
+        res, records = self.log_records(lambda: self.client().get(
+            f'/venues/{self.venue_id}', headers={'X-Request-ID': 'booking-42'}))
+        entry = records[-1]
+
+        self.assertEqual(res.headers['X-Request-ID'], 'booking-42')
+        self.assertEqual(entry['request_id'], 'booking-42')
+        self.assertEqual(entry['route'], '/venues/<int:venue_id>')
+        self.assertEqual(entry['status'], 200)
+        self.assertGreater(entry['db_queries'], 0)
+        self.assertGreaterEqual(entry['duration_ms'], entry['db_time_ms'])
+
+    def test_failed_statement_leaves_no_timing_behind(self):
+        with db.engine.connect() as conn:
+            with self.assertRaises(DBAPIError):
+                conn.execute('SELECT * FROM no_such_table')
+            leftover = conn.info.get('query_started', [])
+
+        self.assertEqual(leftover, [])
+
+    def test_failed_submission_is_logged_with_request_id(self):
+        res, records = self.log_records(lambda: self.client().post('/shows/create', data={
+            'venue_id': self.venue_id,
+            'artist_id': self.artist_id + 1,
+            'start_time': '2035-05-21 21:30:00'
+        }))
+        error = next(record for record in records if record['level'] == 'ERROR')
+
+        self.assertEqual(error['message'], 'Show could not be listed')
+        self.assertIn('IntegrityError', error['exc'])
+        self.assertEqual(error['request_id'], res.headers['X-Request-ID'])
+
+    def test_perf_reports_queries_per_endpoint(self):
+        perf.clear()
+        self.add_shows(3)
+        res = self.client().get(f'/venues/{self.venue_id}')
+        self.client().get(f'/venues/{self.venue_id}')
+        stats = json.loads(self.client().get('/__perf').data)['show_venue']
+
+        self.assertIn('desc="3 queries, 5 rows"', res.headers['Server-Timing'])
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['max_queries'], 3)
+        self.assertEqual(stats['repeated'], [])
+
+    def test_perf_and_request_log_share_one_timing(self):
+        res, records = self.log_records(lambda: self.client().get(f'/venues/{self.venue_id}'))
+        entry = records[-1]
+        db_timing = res.headers.getlist('Server-Timing')[0]
+
+        self.assertIn('{} queries'.format(entry['db_queries']), db_timing)
+        self.assertIn('db;dur={:.2f};'.format(entry['db_time_ms']), db_timing)
+
+    def test_query_budget_fails_requests_over_it(self):
+        app.config['PERF_QUERY_BUDGETS'] = {'show_venue': 2}
+        db.session.remove()
+
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client().get(f'/venues/{self.venue_id}')
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            fingerprint('SELECT name FROM "Venue"\n WHERE id IN (%(id_1)s, %(id_2)s)'
+                        " AND city = 'San Francisco' LIMIT 20"),
+            'SELECT name FROM "Venue" WHERE id IN (?) AND city = ? LIMIT ?')
+
+    def test_datetime_filter_matches_babel(self):
+        value = datetime(2035, 5, 21, 21, 30)
+        aware = datetime(2035, 5, 21, 21, 30, tzinfo=tz.gettz('America/New_York'))
+
+        self.assertEqual(format_datetime(value, 'full'), babel.dates.format_datetime(
+            value, "EEEE MMMM, d, y 'at' h:mma"))
+        self.assertEqual(format_datetime('2035-05-21T21:30:00', 'full'),
+                         format_datetime(value, 'full'))
+        self.assertEqual(format_datetime(aware, 'yyyy-MM-dd HH:mm zzz'),
+                         babel.dates.format_datetime(aware, 'yyyy-MM-dd HH:mm zzz'))
+        self.assertEqual(format_datetime(value, 'medium', locale='fr'),
+                         babel.dates.format_datetime(value, 'EE MM, dd, y h:mma', locale='fr'))
+
+    def write_file(self, suffix, content):
+        f = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        f.write(content)
+        f.close()
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_invalid_choices_are_form_errors(self):
+        with app.test_request_context():
+            form = VenueForm(MultiDict([('state', 'ZZ'), ('genres', 'Polka')]),
+                             meta={'csrf': False})
+            valid = form.validate()
+            # WTForms 3 only turns ValidationError into a form error
+            with self.assertRaises(ValidationError):
+                form.state.pre_validate(form)
+            with self.assertRaises(ValidationError):
+                form.genres.pre_validate(form)
+
+        self.assertFalse(valid)
+        self.assertIn('state', form.errors)
+        self.assertIn('genres', form.errors)
+
+    def test_import_venues_rejects_invalid_rows(self):
+        path = self.write_file('.csv', (
+            'name,city,state,address,phone,genres,image_link,website_link,'
+            'facebook_link,seeking_talent,seeking_description\n'
+            'The Dueling Pianos Bar,New York,NY,335 Delancey Street,914-003-1132,'
+            '"Classical,R&B",,,,False,\n'
+            'Polka Hall,New York,NY,1 Main St,,Polka,,,,False,\n'))
+        rejects = path + '.rejects'
+        self.addCleanup(os.remove, rejects)
+        result = app.test_cli_runner().invoke(
+            args=['import', 'venues', path, '--rejects', rejects])
+        venue = Venue.query.filter_by(name='The Dueling Pianos Bar').one()
+        with open(rejects) as f:
+            rejected = [json.loads(line) for line in f]
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('1 venues imported, 1 rejected', result.output)
+        self.assertEqual(venue.genres, ['Classical', 'R&B'])
+        self.assertEqual(venue.website, 'No Website')
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(rejected[0]['line'], 3)
+        self.assertIn('genres', rejected[0]['errors'])
+
+    def test_import_writes_rejects_where_help_says(self):
+        path = self.write_file('.jsonl', json.dumps({'name': 'Nameless'}))
+        rejects = os.path.splitext(path)[0] + '.rejects.jsonl'
+        self.addCleanup(os.remove, rejects)
+        result = app.test_cli_runner().invoke(args=['import', 'venues', path])
+        help = app.test_cli_runner().invoke(args=['import', '--help'])
+
+        self.assertIn('Rejected rows written to {}'.format(rejects), result.output)
+        self.assertTrue(os.path.exists(rejects))
+        self.assertIn('replaced by .rejects.jsonl', ' '.join(help.output.split()))
+
+    def test_import_shows_on_cached_venues_page(self):
+        app.config['RESPONSE_CACHE_ENABLED'] = True
+        cache.clear()
+        self.client().get('/venues')
+        path = self.write_file('.csv', (
+            'name,city,state,address,phone,genres,image_link,website_link,'
+            'facebook_link,seeking_talent,seeking_description\n'
+            'The Dueling Pianos Bar,New York,NY,335 Delancey Street,914-003-1132,'
+            'Classical,,,,False,\n'))
+        app.test_cli_runner().invoke(args=['import', 'venues', path])
+        res = self.client().get('/venues')
+
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+
+    def test_import_shows_rejects_unknown_ids(self):
+        path = self.write_file('.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'venue_id': self.venue_id, 'artist_id': self.artist_id,
+             'start_time': '2035-05-21 21:30:00'},
+            {'venue_id': self.venue_id, 'artist_id': self.artist_id + 1,
+             'start_time': '2035-05-21 21:30:00'}
+        ]))
+        rejects = path + '.rejects'
+        self.addCleanup(os.remove, rejects)
+        result = app.test_cli_runner().invoke(
+            args=['import', 'shows', path, '--chunk-size', '1', '--rejects', rejects])
+        res = self.client().get(f'/venues/{self.venue_id}')
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('1 shows imported, 1 rejected', result.output)
+        self.assertIn(b'1 Upcoming Show', res.data)
+
+    def upcoming_shows(self, model, id):
+        count = db.session.query(upcoming_shows_count(model, model.id)).filter(
+            model.id == id).scalar()
+        db.session.remove()
+        return count
+
+    def test_show_stats_stay_exact_between_refreshes(self):
+        self.add_shows(3)
+        self.add_shows(1, start_time=datetime(2019, 5, 21, 21, 30))
+        before_refresh = self.upcoming_shows(Venue, self.venue_id)
+        result = app.test_cli_runner().invoke(args=['stats', 'refresh'])
+        after_refresh = self.upcoming_shows(Venue, self.venue_id)
+        self.add_shows(1)
+        after_insert = self.upcoming_shows(Artist, self.artist_id)
+        # a counted show starting after the refresh moves to past when read
+        show = Show.query.filter(Show.start_time > datetime(2030, 1, 1)).first()
+        show.start_time = db.func.now()
+        db.session.commit()
+        after_start = self.upcoming_shows(Venue, self.venue_id)
+        check = app.test_cli_runner().invoke(args=['stats', 'check'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual((before_refresh, after_refresh, after_insert, after_start),
+                         (3, 3, 4, 3))
+        self.assertEqual(check.exit_code, 0)
+        self.assertIn('No drift', check.output)
+
+    def test_stats_check_reports_drift(self):
+        self.add_shows(2)
+        app.test_cli_runner().invoke(args=['stats', 'refresh'])
+        VenueStats.query.get(self.venue_id).upcoming_shows_count = 5
+        db.session.commit()
+        check = app.test_cli_runner().invoke(args=['stats', 'check'])
+        app.test_cli_runner().invoke(args=['stats', 'rebuild'])
+        recheck = app.test_cli_runner().invoke(args=['stats', 'check'])
+
+        self.assertEqual(check.exit_code, 1)
+        self.assertIn(f'Venue {self.venue_id}: expected 2 upcoming/0 past, read 5/0',
+                      check.output)
+        self.assertEqual(recheck.exit_code, 0)
+
+    def test_batch_delete_venues_takes_their_shows(self):
+        self.add_venue('Park Square Live Music & Coffee', 'San Francisco', 'CA')
+        other = Venue.query.filter_by(name='Park Square Live Music & Coffee').one().id
+        self.add_shows(3)
+        app.test_cli_runner().invoke(args=['stats', 'refresh'])
+        res = self.client().delete('/venues', json={'ids': [self.venue_id, other, 100000]})
+        check = app.test_cli_runner().invoke(args=['stats', 'check'])
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json(), {'success': True,
+                                          'deleted': sorted([self.venue_id, other])})
+        self.assertEqual(Venue.query.count(), 0)
+        self.assertEqual(Show.query.count(), 0)
+        self.assertEqual(self.upcoming_shows(Artist, self.artist_id), 0)
+        self.assertIn('No drift', check.output)
+
+    def test_400_batch_delete_without_ids(self):
+        app.config['DELETE_BATCH_SIZE'] = 2
+        self.addCleanup(app.config.__setitem__, 'DELETE_BATCH_SIZE', 1000)
+        for body in ({}, {'ids': []}, {'ids': ['1']}, {'ids': [1, 2, 3]}):
+            res = self.client().delete('/artists', json=body)
+            self.assertEqual(res.status_code, 400)
+        self.assertEqual(Artist.query.count(), 1)
+
+    def test_delete_artist(self):
+        self.add_shows(1)
+        res = self.client().delete(f'/artists/{self.artist_id}')
+
+        self.assertEqual(res.get_json(), {'success': True, 'deleted': [self.artist_id]})
+        self.assertEqual(Show.query.count(), 0)
+        self.assertEqual(self.client().get(f'/artists/{self.artist_id}').status_code, 404)
+
+    def test_404_show_venue_does_not_exist(self):
+        res = self.client().get('/venues/100000')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_show_venue_query_count_independent_of_shows(self):
+        self.add_shows(1)
+        few = self.count_queries(f'/venues/{self.venue_id}')
+        self.add_shows(30)
+        many = self.count_queries(f'/venues/{self.venue_id}')
+
+        self.assertEqual(few, many)
+
+    def test_show_artist_query_count_independent_of_shows(self):
+        self.add_shows(1)
+        few = self.count_queries(f'/artists/{self.artist_id}')
+        self.add_shows(30)
+        many = self.count_queries(f'/artists/{self.artist_id}')
+
+        self.assertEqual(few, many)
+
+    def test_shows_keyset_pagination(self):
+        app.config['SHOWS_PER_PAGE'] = 2
+        self.add_shows(3)
+        res = self.client().get('/shows')
+        next_link = res.data.split(b'/shows?cursor=')[1].split(b'"')[0]
+        res_next = self.client().get('/shows?cursor=' + next_link.decode())
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data.count(b'tile-show'), 2)
+        self.assertEqual(res_next.status_code, 200)
+        self.assertEqual(res_next.data.count(b'tile-show'), 1)
+        self.assertNotIn(b'/shows?cursor=', res_next.data)
+
+    def test_shows_time_range(self):
+        self.add_shows(2)
+        self.add_shows(1, start_time=datetime(2035, 6, 1, 20, 0))
+        res = self.client().get('/shows?from=2035-05-20&to=2035-05-23')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data.count(b'tile-show'), 2)
+
+    def test_400_shows_bad_time_range(self):
+        res = self.client().get('/shows?from=someday')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_400_shows_bad_cursor(self):
+        res = self.client().get('/shows?cursor=not-a-cursor')
+
+        self.assertEqual(res.status_code, 400)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -1,19 +1,206 @@
 import os
-from flask import Flask, request, abort, jsonify
+import base64
+import bisect
+from flask import Flask, current_app, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 import json
+from array import array
+from time import monotonic
 
-from models import setup_db, Question, Category
+from models import setup_db, database_path, db, Question, Category, search_query, search_vector
+from .perf import QueryProfiler, query_budget
+from .search_index import SearchIndex
 
 QUESTIONS_PER_PAGE = 10
+# seconds a worker reuses the total question count; adding or deleting a
+# question through the worker resets it, other workers catch up within this
+QUESTION_COUNT_TTL = 30
+# searches count, and full-text searches rank, only this many matches; a
+# common word can match much of the table
+SEARCH_MATCH_LIMIT = 1000
+# seconds a worker reuses each category's question ids for quizzes; adding
+# or deleting a question through the worker updates them, a question deleted
+# by another worker is skipped when drawn, one added by another worker is
+# drawn once the ids are read again
+QUIZ_IDS_TTL = 300
+
+
+class CachedIds(object):
+    """The ids of each category's questions, reused for ttl seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.ids = {}
+
+    def get(self, category=None):
+        # None and 0 both mean every category
+        key = str(category) if category else None
+        ids, expires = self.ids.get(key, (None, 0))
+        if ids is None or monotonic() >= expires:
+            query = db.session.query(db.func.array_agg(Question.id))
+            if key:
+                query = query.filter(Question.category == key)
+            # one array instead of a row per id, 8 times faster on millions
+            ids = array('l', query.scalar() or ())
+            self.ids[key] = ids, monotonic() + self.ttl
+        return ids
+
+    def add(self, question):
+        for key in (str(question.category), None):
+            if key in self.ids:
+                self.ids[key][0].append(question.id)
+
+    def remove(self, question):
+        for key in (str(question.category), None):
+            if key in self.ids and question.id in self.ids[key][0]:
+                self.ids[key][0].remove(question.id)
+
+
+class CachedCount(object):
+    """The result of a COUNT query, reused for ttl seconds."""
+
+    def __init__(self, query, ttl):
+        self.query = query
+        self.ttl = ttl
+        self.value = None
+        self.expires = 0
+
+    def get(self):
+        if self.value is None or monotonic() >= self.expires:
+            self.value = self.query().scalar()
+            self.expires = monotonic() + self.ttl
+        return self.value
+
+    def clear(self):
+        self.value = None
+
+
+def encode_cursor(question_id, category=None):
+    position = json.dumps([question_id, category], separators=(',', ':'))
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, category=None):
+    """The question id a cursor resumes after; 400 for a malformed cursor
+    or one issued for another category. An empty cursor starts at the top."""
+    if not cursor:
+        return 0
+    try:
+        question_id, cursor_category = json.loads(
+            base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        abort(400)
+    if not isinstance(question_id, int) or cursor_category != category:
+        abort(400)
+    return question_id
+
+
+def paginate(query, category=None, rank=None, sparse=False):
+    """One page of the query's questions and the cursor of the next page,
+    None on the last one.
+
+    With ?cursor= the page starts after the id in the cursor, a range scan
+    on the primary key however deep it is. Otherwise ?page= is an OFFSET,
+    which the frontend still uses. Questions ordered by a search rank are
+    paged with ?page= only. For a sparse query, one known to match few
+    questions, the matches are found through its own indexes and sorted
+    rather than met walking the primary key."""
+    per_page = current_app.config['QUESTIONS_PER_PAGE']
+    cursor = request.args.get('cursor')
+    if rank is not None:
+        if cursor is not None:
+            abort(400)
+        query = query.order_by(rank.desc(), Question.id)
+    elif sparse:
+        # the planner can't use the primary key to sort by id + 0
+        query = query.order_by(Question.id + 0)
+    else:
+        query = query.order_by(Question.id)
+    if cursor is not None:
+        query = query.filter(Question.id > decode_cursor(cursor, category))
+    else:
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
+            abort(400)
+        query = query.offset((page - 1) * per_page)
+    # the extra row tells whether there is a next page
+    questions = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(questions) > per_page:
+        questions = questions[:per_page]
+        if rank is None:
+            next_cursor = encode_cursor(questions[-1].id, category)
+    return questions, next_cursor
+
+
+def paginate_ids(ids):
+    """paginate() over a sorted list of question ids."""
+    per_page = current_app.config['QUESTIONS_PER_PAGE']
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        start = bisect.bisect_right(ids, decode_cursor(cursor))
+    else:
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
+            abort(400)
+        start = (page - 1) * per_page
+    page_ids = ids[start:start + per_page]
+    next_cursor = None
+    if start + per_page < len(ids):
+        next_cursor = encode_cursor(page_ids[-1])
+    return page_ids, next_cursor
+
+
+def capped_count(query, limit):
+    return db.session.query(db.func.count()).select_from(
+        query.with_entities(Question.id).limit(limit).subquery()).scalar()
+
+
+def random_question(question_ids, exclude=()):
+    """A question drawn uniformly from question_ids, leaving out those in
+    exclude; None when there is none left.
+
+    While at least half the ids are left, ids are drawn until one is not
+    excluded, two draws on average; past that the ids left are listed and
+    one of them drawn. Only the drawn question is read."""
+    exclude = set(exclude)
+    while True:
+        if len(exclude) < len(question_ids) // 2:
+            question_id = random.choice(question_ids)
+            if question_id in exclude:
+                continue
+        else:
+            left = [id for id in question_ids if id not in exclude]
+            if not left:
+                return None
+            question_id = random.choice(left)
+        question = Question.query.get(question_id)
+        if question is not None:
+            return question
+        # deleted by another worker since the ids were read
+        exclude.add(question_id)
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    app.config['PERF_ENABLED'] = os.environ.get('PERF_ENABLED') == '1'
+    app.config['QUESTIONS_PER_PAGE'] = QUESTIONS_PER_PAGE
+    app.config['QUESTION_COUNT_TTL'] = QUESTION_COUNT_TTL
+    app.config['SEARCH_MATCH_LIMIT'] = SEARCH_MATCH_LIMIT
+    app.config['QUIZ_IDS_TTL'] = QUIZ_IDS_TTL
+    app.config['SEARCH_INDEX_ENABLED'] = os.environ.get('SEARCH_INDEX') == '1'
+    if test_config is not None:
+        app.config.update(test_config)
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI') or database_path)
+    QueryProfiler(app)
+    # substring searches over question text answered from memory
+    search_index = SearchIndex(app) if app.config['SEARCH_INDEX_ENABLED'] else None
+    question_count = CachedCount(lambda: db.session.query(db.func.count(Question.id)),
+                                 app.config['QUESTION_COUNT_TTL'])
+    quiz_ids = CachedIds(app.config['QUIZ_IDS_TTL'])
     CORS(app)
     '''
     @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -35,6 +222,7 @@ def create_app(test_config=None):
     for all available categories.
     '''
     @app.route('/categories')
+    @query_budget(1)
     def all_categories():
         categories = Category.query.all()
         # print(f'Output {categories[0].type}')
@@ -59,24 +247,18 @@ def create_app(test_config=None):
     Clicking on the page numbers should update the questions. 
     '''
     @app.route('/questions')
+    @query_budget(3)
     def get_questions():
-        page = request.args.get('page', 1, type=int)
-        start = (page - 1) * 10
-        end = start + 10
-        questions = Question.query.all()
+        questions, next_cursor = paginate(Question.query)
         categories = Category.query.all()
-        count = 0
-        for question in questions:
-            count += 1
-        formatted_questions = [question.format() for question in questions]
         jsonified_categories = {}
-        print(count)
         for category in categories:
             jsonified_categories[f'{category.id}'] = category.type
         return jsonify({
             'success': True,
-            'questions': formatted_questions[start:end],
-            'total_questions': count,
+            'questions': [question.format() for question in questions],
+            'total_questions': question_count.get(),
+            'next_cursor': next_cursor,
             'categories': jsonified_categories,
             'current_category': 'test'
         })
@@ -92,6 +274,10 @@ def create_app(test_config=None):
     def delete_question(question_id):
         selected_question = Question.query.get(question_id)
         selected_question.delete()
+        question_count.clear()
+        quiz_ids.remove(selected_question)
+        if search_index is not None:
+            search_index.remove(question_id)
 
         return jsonify({
             'success': True
@@ -114,7 +300,12 @@ def create_app(test_config=None):
         difficulty = int(new_question['difficulty'])
         category = int(new_question['category'])
 
-        Question(question, answer, category, difficulty).insert()
+        inserted = Question(question, answer, category, difficulty)
+        inserted.insert()
+        question_count.clear()
+        quiz_ids.add(inserted)
+        if search_index is not None:
+            search_index.add(inserted)
         return jsonify({
             'success': True
         })
@@ -130,23 +321,53 @@ def create_app(test_config=None):
     Try using the word "title" to start. 
     '''
     @app.route('/questions', methods=["POST"])
+    @query_budget(2)
     def search_questions():
-        page = request.args.get('page', 1, type=int)
-        start = (page - 1) * 10
-        end = start + 10
         search_term = json.loads(request.data)
-        search_term_lower = search_term['searchTerm'].lower()
-        questions = Question.query.all()
-        count = 0
-        data = []
-        for question in questions:
-            if search_term_lower in question.question.lower():
-                count += 1
-                data.append(question.format())
+        columns = [Question.question]
+        if search_term.get('searchAnswers'):
+            columns.append(Question.answer)
+        limit = app.config['SEARCH_MATCH_LIMIT']
+        if (search_index is not None and len(columns) == 1
+                and not search_term.get('fullText') and search_index.in_sync()):
+            ids = search_index.search(search_term['searchTerm'])
+            page_ids, next_cursor = paginate_ids(ids)
+            formatted = search_index.format(page_ids)
+            # capped like the database searches, so total_capped means the same
+            total = min(len(ids), limit)
+        elif search_term.get('fullText'):
+            # words matched by stem through the tsvector indexes, best first
+            # among the first SEARCH_MATCH_LIMIT matches the index returns;
+            # ranking every match of a common word takes seconds, so past the
+            # limit the order is only approximate and total_capped says so
+            query = search_query(search_term['searchTerm'])
+            matching = Question.query.filter(db.or_(
+                *[search_vector(column).op('@@')(query) for column in columns]
+            )).limit(limit).from_self()
+            ranks = [db.func.ts_rank(search_vector(column), query) for column in columns]
+            # the matches are counted in the same scan; a page past the last
+            # one has no row to carry the count
+            rows, next_cursor = paginate(matching.add_columns(db.func.count().over()),
+                                         rank=sum(ranks[1:], ranks[0]))
+            formatted = [question.format() for question, _ in rows]
+            total = rows[0][1] if rows else capped_count(matching, limit)
+        else:
+            # a substring match through the trigram indexes, so the term's
+            # own % and _ are escaped
+            term = search_term['searchTerm'].replace('/', '//').replace(
+                '%', '/%').replace('_', '/_')
+            matching = Question.query.filter(db.or_(
+                *[column.ilike('%{}%'.format(term), escape='/') for column in columns]))
+            total = capped_count(matching, limit)
+            questions, next_cursor = paginate(matching, sparse=total < limit)
+            formatted = [question.format() for question in questions]
         return jsonify({
             'success': True,
-            'questions': data[start:end],
-            'total_questions': count,
+            'questions': formatted,
+            'total_questions': total,
+            # the count stopped at SEARCH_MATCH_LIMIT; more questions may match
+            'total_capped': total >= limit,
+            'next_cursor': next_cursor,
             'current_category': 'test'
         })
     '''
@@ -158,22 +379,18 @@ def create_app(test_config=None):
     category to be shown. 
     '''
     @app.route('/categories/<int:category_id>/questions')
+    @query_budget(3)
     def get_by_category(category_id):
-        page = request.args.get('page', 1, type=int)
-        start = (page - 1) * 10
-        end = start + 10
-        questions = Question.query.filter_by(category=category_id).all()
-        category = Category.query.get(category_id)
-        count = 0
-        for question in questions:
-            count += 1
-        formatted_questions = [question.format() for question in questions]
+        category = Category.query.get_or_404(category_id)
+        in_category = Question.query.filter_by(category=str(category_id))
+        questions, next_cursor = paginate(in_category, category_id)
         jsonified_category = {}
         jsonified_category[f'{category.id}'] = category.type
         return jsonify({
             'success': True,
-            'questions': formatted_questions[start:end],
-            'total_questions': count,
+            'questions': [question.format() for question in questions],
+            'total_questions': in_category.count(),
+            'next_cursor': next_cursor,
             'current_category': jsonified_category
         })
 
@@ -189,25 +406,16 @@ def create_app(test_config=None):
     and shown whether they were correct or not. 
     '''
     @app.route('/quizzes', methods=["POST"])
+    @query_budget(2)
     def quiz():
-        search_term = json.loads(request.data)
-        previous_questions = search_term['previous_questions']
-        quiz_category = int(search_term['quiz_category']['id'])
-        print(previous_questions)
-        print(quiz_category)
-        if quiz_category == 0:
-            questions = Question.query.all()
-        else:
-            questions = Question.query.filter_by(category=quiz_category).all()
-        data = []
-        for question in questions:
-            if not question.id in previous_questions:
-                data.append(question.format())
-        if not data:
-            question = False
-        else:
-            rand = random.randint(0, len(data)-1)
-            question = data[rand]
+        body = json.loads(request.data)
+        try:
+            previous_questions = [int(id) for id in body['previous_questions']]
+            quiz_category = int(body['quiz_category']['id'])
+        except (KeyError, TypeError, ValueError):
+            abort(400)
+        question = random_question(quiz_ids.get(quiz_category), previous_questions)
+        question = question.format() if question else False
         return jsonify({
             'success': True,
             'question': question,
@@ -0,0 +1,261 @@
+# In-memory question search.
+#
+# With SEARCH_INDEX=1 in the environment (SEARCH_INDEX_ENABLED in the
+# config), the app loads every question in the background at startup and
+# answers substring searches over question text from memory; until the load
+# is done, searches go to the database. Each word of a question maps to a
+# sorted array of the ids of the questions containing it.
+# A search term is broken into the same words; the questions that can match
+# are those holding a word that contains the term's rarest word, found by
+# scanning the vocabulary, and the term itself is then checked against
+# their text. Adding or deleting a question through the app updates the
+# index in place. Every SEARCH_INDEX_CHECK_SECONDS the index compares its
+# question count and highest id with the database; if another worker changed
+# the questions, the index is rebuilt in the background and searches go to
+# the database until it is done. /__search_index reports its size as of the
+# last build.
+
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from time import monotonic, perf_counter
+
+from flask import jsonify
+
+from models import db, Question
+
+WORD = re.compile(r'\w+')
+
+
+def words(text):
+    return set(WORD.findall(text.lower())) if text else set()
+
+
+class Postings(object):
+    """Question rows and the word postings over their text."""
+
+    def __init__(self):
+        # id -> (question, answer, category, difficulty)
+        self.rows = {}
+        self.postings = {}
+        # ids over all the postings, kept up to date for /__search_index
+        self.posting_count = 0
+        self._max_id = None
+        # the vocabulary as one string, each word followed by a newline, so
+        # the words containing a fragment are found by str.find
+        self.vocabulary = []
+        self.offsets = array('l')
+        self.text = ''
+
+    def add(self, id, row):
+        """Index a row; returns the words new to the vocabulary."""
+        self.rows[id] = row
+        if self._max_id is not None and id > self._max_id:
+            self._max_id = id
+        new_words = []
+        for word in words(row[0]):
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = array('l')
+                new_words.append(word)
+            if not posting or posting[-1] < id:
+                posting.append(id)
+            else:
+                posting.insert(bisect_left(posting, id), id)
+            self.posting_count += 1
+        return new_words
+
+    def extend_vocabulary(self, new_words):
+        offset = len(self.text)
+        for word in new_words:
+            self.offsets.append(offset)
+            offset += len(word) + 1
+        self.vocabulary.extend(new_words)
+        self.text += ''.join(word + '\n' for word in new_words)
+
+    def remove(self, id):
+        row = self.rows.pop(id, None)
+        if row is None:
+            return
+        if id == self._max_id:
+            self._max_id = None
+        for word in words(row[0]):
+            posting = self.postings[word]
+            i = bisect_left(posting, id)
+            if i < len(posting) and posting[i] == id:
+                del posting[i]
+                self.posting_count -= 1
+
+    @property
+    def max_id(self):
+        if self._max_id is None and self.rows:
+            self._max_id = max(self.rows)
+        return self._max_id
+
+    def words_containing(self, fragment):
+        found = []
+        start = self.text.find(fragment)
+        while start != -1:
+            i = bisect_right(self.offsets, start) - 1
+            found.append(self.vocabulary[i])
+            start = self.text.find(fragment, self.text.index('\n', start) + 1)
+        return found
+
+    def search(self, term):
+        term = term.lower()
+        fragments = WORD.findall(term)
+        if not fragments:
+            return sorted(id for id, row in self.rows.items()
+                          if row[0] and term in row[0].lower())
+        candidates = None
+        for fragment in set(fragments):
+            postings = [self.postings[word] for word in self.words_containing(fragment)]
+            if candidates is None or sum(map(len, postings)) < sum(map(len, candidates)):
+                candidates = postings
+        if len(candidates) == 1:
+            ids = candidates[0][:]
+        else:
+            ids = sorted(set().union(*candidates))
+        if fragments == [term]:
+            # every question with a word containing the term contains it
+            return ids
+        return [id for id in ids if term in self.rows[id][0].lower()]
+
+    def memory_usage(self):
+        postings = sys.getsizeof(self.postings) + sum(
+            sys.getsizeof(posting) for posting in self.postings.values())
+        vocabulary = (sys.getsizeof(self.vocabulary) + sys.getsizeof(self.offsets)
+                      + sys.getsizeof(self.text)
+                      + sum(sys.getsizeof(word) for word in self.vocabulary))
+        rows = sys.getsizeof(self.rows) + sum(
+            sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+            for row in self.rows.values())
+        return {'postings': postings, 'vocabulary': vocabulary, 'rows': rows,
+                'total': postings + vocabulary + rows}
+
+
+def load():
+    index = Postings()
+    new_words = []
+    # in id order, so every id is appended to its postings
+    for id, *row in db.session.query(
+            Question.id, Question.question, Question.answer, Question.category,
+            Question.difficulty).order_by(Question.id).yield_per(10000):
+        new_words.extend(index.add(id, tuple(row)))
+    db.session.remove()
+    # joined once; growing the string word by word copies it every time
+    index.extend_vocabulary(new_words)
+    return index
+
+
+class SearchIndex(object):
+
+    def __init__(self, app=None):
+        self.app = None
+        self.index = Postings()
+        # as of the last build; questions added or deleted since are left out
+        self.memory = self.index.memory_usage()
+        self.building = False
+        self._next_check = 0
+        self._lock = threading.RLock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_INDEX_CHECK_SECONDS', 30)
+        self.app = app
+        app.add_url_rule('/__search_index', 'search_index_stats', self.stats_view)
+        # loading millions of questions takes the better part of a minute;
+        # the worker serves from the database meanwhile
+        self.building = True
+        self._start_build()
+
+    def build(self):
+        started = perf_counter()
+        index = load()
+        # the memory walk takes seconds on millions of questions, so it is
+        # done here, before searches share the index, and not under the lock
+        memory = index.memory_usage()
+        with self._lock:
+            self.index = index
+            self.memory = memory
+            self._next_check = monotonic() + self.app.config['SEARCH_INDEX_CHECK_SECONDS']
+        self.app.logger.info('Search index built in %.1f s: %d questions, %d words',
+                             perf_counter() - started, len(index.rows), len(index.postings))
+
+    def _start_build(self):
+        threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            with self.app.app_context():
+                self.build()
+        except Exception:
+            self.app.logger.exception('Search index could not be rebuilt')
+        finally:
+            self.building = False
+
+    def in_sync(self):
+        """Whether the index holds the questions the database does, as far
+        as the last check could tell; starts a rebuild when it doesn't."""
+        with self._lock:
+            if self.building:
+                return False
+            if monotonic() < self._next_check:
+                return True
+            self._next_check = monotonic() + self.app.config['SEARCH_INDEX_CHECK_SECONDS']
+        count, max_id = db.session.query(
+            db.func.count(Question.id), db.func.max(Question.id)).one()
+        with self._lock:
+            if (count, max_id) == (len(self.index.rows), self.index.max_id):
+                return True
+            if self.building:
+                return False
+            self.app.logger.warning('Search index out of sync (%d questions, %d in the '
+                                    'database), rebuilding', len(self.index.rows), count)
+            self.building = True
+        self._start_build()
+        return False
+
+    def add(self, question):
+        with self._lock:
+            self.index.extend_vocabulary(self.index.add(question.id, (
+                question.question, question.answer, question.category,
+                question.difficulty)))
+
+    def remove(self, question_id):
+        with self._lock:
+            self.index.remove(question_id)
+
+    def search(self, term):
+        """Ids of the questions containing term, case-insensitively, in
+        ascending order."""
+        with self._lock:
+            return self.index.search(term)
+
+    def format(self, question_ids):
+        """Question.format() of each of these questions still indexed."""
+        with self._lock:
+            rows = [(id, self.index.rows.get(id)) for id in question_ids]
+        return [{
+            'id': id,
+            'question': row[0],
+            'answer': row[1],
+            'category': row[2],
+            'difficulty': row[3]
+        } for id, row in rows if row is not None]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'questions': len(self.index.rows),
+                'words': len(self.index.postings),
+                'postings': self.index.posting_count,
+                'building': self.building,
+                'memory_bytes': self.memory
+            }
+
+    def stats_view(self):
+        return jsonify(self.stats())
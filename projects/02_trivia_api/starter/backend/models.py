@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, DDL, create_engine, event, func, literal_column
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -8,6 +8,13 @@ database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
 db = SQLAlchemy()
 
+# text search configuration of the full-text indexes; queries must use the
+# same one for Postgres to pick them
+SEARCH_CONFIG = 'english'
+
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
@@ -19,9 +26,18 @@ def setup_db(app, database_path=database_path):
     db.init_app(app)
     db.create_all()
 
+def search_vector(column):
+  return func.to_tsvector(literal_column("'{}'".format(SEARCH_CONFIG)), column)
+
+def search_query(text):
+  # quoted phrases, OR and -word work as in web search boxes
+  return func.websearch_to_tsquery(literal_column("'{}'".format(SEARCH_CONFIG)), text)
+
 '''
 Question
-
+    trigram indexes serve substring (ILIKE) matches and the tsvector ones
+    full-text matches, on both the question and the answer text; the
+    (category, id) index serves category listings and quiz draws
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
@@ -31,6 +47,16 @@ class Question(db.Model):
   answer = Column(String)
   category = Column(String)
   difficulty = Column(Integer)
+  __table_args__ = (
+    db.Index('ix_questions_question_trgm', 'question', postgresql_using='gin',
+             postgresql_ops={'question': 'gin_trgm_ops'}),
+    db.Index('ix_questions_answer_trgm', 'answer', postgresql_using='gin',
+             postgresql_ops={'answer': 'gin_trgm_ops'}),
+    db.Index('ix_questions_question_fts', search_vector(question), postgresql_using='gin'),
+    db.Index('ix_questions_answer_fts', search_vector(answer), postgresql_using='gin'),
+    # quizzes read a category's ids from it alone
+    db.Index('ix_questions_category_id', 'category', 'id'),
+  )
 
   def __init__(self, question, answer, category, difficulty):
     self.question = question
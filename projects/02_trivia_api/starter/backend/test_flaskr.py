@@ -1,10 +1,12 @@
 import os
+import time
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.perf import QueryBudgetExceeded
+from models import setup_db, db, Question, Category
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -12,7 +14,7 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
+        self.app = create_app({'PERF_ENABLED': True, 'PERF_FAIL_ON_BUDGET': True})
         self.client = self.app.test_client
         self.database_name = "trivia_test"
         self.database_path = "postgres://{}/{}".format(
@@ -90,6 +92,103 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertTrue(len(data['questions']))
 
+    def test_full_text_search_matches_word_forms(self):
+        substring = json.loads(self.client().post(
+            '/questions', json={'searchTerm': 'singing'}).data)
+        full_text = json.loads(self.client().post(
+            '/questions', json={'searchTerm': 'singing', 'fullText': True}).data)
+
+        self.assertEqual(substring['total_questions'], 0)
+        self.assertGreaterEqual(full_text['total_questions'], 2)
+        self.assertTrue(all('sing' in question['question'].lower()
+                            for question in full_text['questions']))
+
+    def test_search_total_is_capped_visibly(self):
+        app = create_app({'SEARCH_MATCH_LIMIT': 2})
+        setup_db(app, self.database_path)
+        capped = json.loads(app.test_client().post(
+            '/questions', json={'searchTerm': 'e'}).data)
+        exact = json.loads(app.test_client().post(
+            '/questions', json={'searchTerm': 'Cassius'}).data)
+
+        self.assertEqual(capped['total_questions'], 2)
+        self.assertTrue(capped['total_capped'])
+        self.assertEqual(exact['total_questions'], 1)
+        self.assertFalse(exact['total_capped'])
+
+    def test_search_answers(self):
+        questions_only = json.loads(self.client().post(
+            '/questions', json={'searchTerm': 'versailles'}).data)
+        with_answers = json.loads(self.client().post(
+            '/questions', json={'searchTerm': 'versailles', 'searchAnswers': True}).data)
+
+        self.assertEqual(questions_only['total_questions'], 0)
+        self.assertEqual([question['answer'] for question in with_answers['questions']],
+                         ['The Palace of Versailles'])
+
+    def delete_questions(self, app, question):
+        with app.app_context():
+            Question.query.filter_by(question=question).delete()
+            db.session.commit()
+
+    def wait_for_search_index(self, client):
+        # the index is loaded in the background at startup
+        deadline = time.monotonic() + 30
+        while json.loads(client.get('/__search_index').data)['building']:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_search_index_answers_from_memory(self):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': self.database_path,
+                          'SEARCH_INDEX_ENABLED': True, 'PERF_ENABLED': True})
+        client = app.test_client()
+        self.wait_for_search_index(client)
+        built = json.loads(client.get('/__search_index').data)
+        self.addCleanup(self.delete_questions, app, 'Who wrote The Hobbit?')
+        from_db = json.loads(self.client().post('/questions', json={'searchTerm': 'the'}).data)
+        res = client.post('/questions', json={'searchTerm': 'the'})
+        client.post('/addquestions', json={
+            'question': 'Who wrote The Hobbit?', 'answer': 'Tolkien',
+            'difficulty': 2, 'category': 4})
+        added = json.loads(client.post('/questions', json={'searchTerm': 'hobbit?'}).data)
+        client.delete('/questions/{}'.format(added['questions'][0]['id']))
+        deleted = json.loads(client.post('/questions', json={'searchTerm': 'hobbit'}).data)
+        stats = json.loads(client.get('/__search_index').data)
+
+        self.assertIn('desc="0 queries', res.headers['Server-Timing'])
+        self.assertEqual(json.loads(res.data)['questions'], from_db['questions'])
+        self.assertEqual(json.loads(res.data)['total_questions'], from_db['total_questions'])
+        self.assertEqual(added['total_questions'], 1)
+        self.assertEqual(deleted['total_questions'], 0)
+        self.assertGreater(stats['memory_bytes']['postings'], 0)
+        self.assertEqual(stats['postings'], built['postings'])
+
+    def test_search_index_out_of_sync_falls_back_to_sql(self):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': self.database_path,
+                          'SEARCH_INDEX_ENABLED': True, 'SEARCH_INDEX_CHECK_SECONDS': 0})
+        self.wait_for_search_index(app.test_client())
+        with app.app_context():
+            # added by another worker
+            Question('Who painted Guernica?', 'Picasso', 2, 3).insert()
+        self.addCleanup(self.delete_questions, app, 'Who painted Guernica?')
+        res = json.loads(app.test_client().post(
+            '/questions', json={'searchTerm': 'guernica'}).data)
+
+        self.assertEqual(res['total_questions'], 1)
+
+    def test_search_index_caps_total_like_sql(self):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': self.database_path,
+                          'SEARCH_INDEX_ENABLED': True, 'SEARCH_MATCH_LIMIT': 2,
+                          'PERF_ENABLED': True})
+        client = app.test_client()
+        self.wait_for_search_index(client)
+        res = client.post('/questions', json={'searchTerm': 'e'})
+        data = json.loads(res.data)
+
+        self.assertIn('desc="0 queries', res.headers['Server-Timing'])
+        self.assertEqual(data['total_questions'], 2)
+        self.assertTrue(data['total_capped'])
+
     def test_get_all_questions_by_category(self):
         res = self.client().get('/categories/1/questions')
         data = json.loads(res.data)
@@ -111,6 +210,118 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['question'])
         self.assertTrue(len(data['question']))
 
+    def test_quiz_skips_previous_questions_until_none_are_left(self):
+        with self.app.app_context():
+            ids = [id for id, in db.session.query(Question.id).filter_by(category=2)]
+        asked = []
+        for _ in ids:
+            res = self.client().post('/quizzes', json={
+                'previous_questions': asked,
+                'quiz_category': {'id': 2}})
+            question = json.loads(res.data)['question']
+            self.assertEqual(question['category'], 2)
+            self.assertNotIn(question['id'], asked)
+            asked.append(question['id'])
+        res = self.client().post('/quizzes', json={
+            'previous_questions': asked,
+            'quiz_category': {'id': 2}})
+
+        self.assertCountEqual(asked, ids)
+        self.assertEqual(json.loads(res.data)['question'], False)
+        # the category's ids are cached and none is left to read
+        self.assertIn('desc="0 queries', res.headers['Server-Timing'])
+
+    def test_quiz_draws_evenly_after_a_long_exclude_list(self):
+        with self.app.app_context():
+            ids = [id for id, in db.session.query(Question.id).order_by(Question.id)]
+        # a question right after a long run of asked ones must not come up
+        # more often than the others
+        left = [ids[len(ids) // 2], ids[-2], ids[-1]]
+        asked = [id for id in ids if id not in left]
+        client = self.client()
+        drawn = {id: 0 for id in left}
+        for _ in range(300):
+            res = client.post('/quizzes', json={
+                'previous_questions': asked,
+                'quiz_category': {'id': 0}})
+            drawn[json.loads(res.data)['question']['id']] += 1
+
+        for count in drawn.values():
+            self.assertGreater(count, 60)
+            self.assertLess(count, 140)
+
+    def test_quiz_draws_questions_added_and_not_deleted(self):
+        client = self.client()
+        with self.app.app_context():
+            ids = [id for id, in db.session.query(Question.id).filter_by(category=2)]
+        quiz = {'previous_questions': ids, 'quiz_category': {'id': 2}}
+        self.assertEqual(json.loads(client.post('/quizzes', json=quiz).data)['question'], False)
+        client.post('/addquestions', json={
+            'question': 'Who painted Guernica?', 'answer': 'Picasso',
+            'difficulty': 2, 'category': 2})
+        self.addCleanup(self.delete_questions, self.app, 'Who painted Guernica?')
+        added = client.post('/quizzes', json=quiz)
+        client.delete('/questions/{}'.format(json.loads(added.data)['question']['id']))
+        deleted = client.post('/quizzes', json=quiz)
+
+        self.assertEqual(json.loads(added.data)['question']['question'], 'Who painted Guernica?')
+        self.assertIn('desc="1 queries', added.headers['Server-Timing'])
+        self.assertEqual(json.loads(deleted.data)['question'], False)
+        self.assertIn('desc="0 queries', deleted.headers['Server-Timing'])
+
+    def test_400_quiz_without_category(self):
+        res = self.client().post('/quizzes', json={'previous_questions': []})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_get_questions_pages_in_sql(self):
+        app = create_app({'QUESTIONS_PER_PAGE': 3})
+        setup_db(app, self.database_path)
+        first = json.loads(app.test_client().get('/questions').data)
+        second = json.loads(app.test_client().get('/questions?page=2').data)
+        with app.app_context():
+            total = Question.query.count()
+        res = app.test_client().get('/questions?page=0')
+
+        self.assertEqual(len(first['questions']), 3)
+        self.assertLess(first['questions'][-1]['id'], second['questions'][0]['id'])
+        self.assertEqual(first['total_questions'], total)
+        self.assertEqual(res.status_code, 400)
+
+    def test_cursor_pages_follow_offset_pages(self):
+        app = create_app({'QUESTIONS_PER_PAGE': 2})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        first = json.loads(client.get('/categories/1/questions?cursor=').data)
+        second = json.loads(client.get(
+            '/categories/1/questions?cursor=' + first['next_cursor']).data)
+        by_page = json.loads(client.get('/categories/1/questions?page=2').data)
+        other_category = client.get(
+            '/categories/2/questions?cursor=' + first['next_cursor'])
+        malformed = client.get('/questions?cursor=not-a-cursor')
+
+        self.assertEqual(second['questions'], by_page['questions'])
+        self.assertEqual(second['next_cursor'], by_page['next_cursor'])
+        self.assertEqual(other_category.status_code, 400)
+        self.assertEqual(malformed.status_code, 400)
+
+    def test_perf_reports_queries_per_endpoint(self):
+        res = self.client().get('/questions')
+        cached_count = self.client().get('/questions')
+        stats = json.loads(self.client().get('/__perf').data)
+
+        self.assertIn('desc="3 queries', res.headers['Server-Timing'])
+        self.assertIn('desc="2 queries', cached_count.headers['Server-Timing'])
+        self.assertEqual(stats['get_questions']['requests'], 2)
+        self.assertEqual(stats['get_questions']['max_queries'], 3)
+
+    def test_query_budget_fails_requests_over_it(self):
+        self.app.config['TESTING'] = True
+        self.app.config['PERF_QUERY_BUDGETS'] = {'all_categories': 0}
+
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client().get('/categories')
+
     def test_400_question_does_not_have_body(self):
         res = self.client().post('/addquestions')
         data = json.loads(res.data)